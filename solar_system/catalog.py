@@ -0,0 +1,249 @@
+import argparse
+import csv
+import json
+import numpy as np
+
+# Binary minor-body catalog read by main.py through numpy.memmap.
+#
+# A catalog is a 64 byte header followed by fixed-width little-endian records
+# sorted by semi-major axis, so every radial band of the scene maps to one
+# contiguous slice of the file. Distances are in simulation units, angles in
+# radians and the mean motion in radians per frame, matching main.py.
+CATALOG_MAGIC = b"SSCATLG"
+CATALOG_VERSION = 2
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("record_size", "<u4"),
+        ("count", "<u8"),
+        ("max_eccentricity", "<f8"),
+        ("max_inclination", "<f8"),  # Tilt out of the plane, 0 to pi / 2
+        ("reserved", "V24"),
+    ]
+)
+
+RECORD_DTYPE = np.dtype(
+    [
+        ("semi_major_axis", "<f4"),
+        ("eccentricity", "<f4"),
+        ("inclination", "<f4"),
+        ("ascending_node", "<f4"),
+        ("argument_of_periapsis", "<f4"),
+        ("mean_anomaly", "<f4"),  # At frame 0
+        ("mean_motion", "<f4"),
+        ("radius", "<f4"),
+    ]
+)
+
+# Columns of the CSV/JSON body lists accepted by the converter. Semi-major
+# axes are in AU and angles in degrees, as in published element tables.
+ANGLE_COLUMNS = (
+    "inclination",
+    "ascending_node",
+    "argument_of_periapsis",
+    "mean_anomaly",
+)
+REQUIRED_COLUMNS = ("semi_major_axis", "eccentricity") + ANGLE_COLUMNS
+
+# The scene is not to scale, so distances are mapped piecewise: linearly in AU
+# between the orbits of the scene's planets and the edges of its two belts,
+# and in proportion to the last of them beyond. Neptune is left out; the
+# scene's Kuiper belt starts well outside its orbit, though both lie at 30 AU.
+SCENE_DISTANCES = (  # (AU, simulation units)
+    (0, 0),
+    (0.39, 30 * 3),  # Mercury
+    (0.72, 50 * 3),  # Venus
+    (1, 70 * 3),  # Earth
+    (1.52, 100 * 3),  # Mars
+    (2.1, 115 * 3),  # Inner edge of the asteroid belt
+    (3.3, 180 * 3),  # Outer edge of the asteroid belt
+    (5.2, 200 * 3),  # Jupiter
+    (9.54, 360 * 3),  # Saturn
+    (19.2, 500 * 3),  # Uranus
+    (30, 30 * 75),  # Inner edge of the Kuiper belt
+    (50, 50 * 75),  # Outer edge of the Kuiper belt
+)
+EARTH_MEAN_MOTION = 0.001 * 3  # Radians per frame at 1 AU
+DEFAULT_RADIUS = 1
+
+
+class Catalog:
+    def __init__(self, path):
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if len(header) != 1 or header["magic"][0] != CATALOG_MAGIC:
+            raise ValueError(f"{path} is not a minor-body catalog")
+        header = header[0]
+        if header["version"] != CATALOG_VERSION:
+            raise ValueError(
+                f"{path} has catalog version {header['version']}, "
+                f"expected {CATALOG_VERSION}"
+            )
+        if header["record_size"] != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{path} has an unexpected record size")
+        self.path = path
+        self.count = int(header["count"])
+        self.max_eccentricity = float(header["max_eccentricity"])
+        self.max_inclination = float(header["max_inclination"])
+        # Nothing is read here; pages come in as records are sliced
+        if self.count:
+            self.records = np.memmap(
+                path,
+                dtype=RECORD_DTYPE,
+                mode="r",
+                offset=HEADER_DTYPE.itemsize,
+                shape=(self.count,),
+            )
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return self.count
+
+    # Slice of records that can come between min_distance and max_distance of
+    # the Sun on the screen. A body strays at most a * e from its semi-major
+    # axis, and an inclined orbit is foreshortened by up to the cosine of its
+    # inclination, so the bounds are widened by the largest eccentricity and
+    # inclination in the catalog. The binary search only touches a handful of
+    # pages.
+    def index_range(self, min_distance, max_distance):
+        axes = self.records["semi_major_axis"]
+        low = np.searchsorted(axes, min_distance / (1 + self.max_eccentricity))
+        nearest = (1 - self.max_eccentricity) * np.cos(self.max_inclination)
+        if nearest <= 0:
+            return int(low), self.count
+        high = np.searchsorted(axes, max_distance / nearest, side="right")
+        return int(low), int(high)
+
+
+def open_catalog(path):
+    return Catalog(path)
+
+
+def write_catalog(path, records):
+    records = np.sort(np.asarray(records, dtype=RECORD_DTYPE), order="semi_major_axis")
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = CATALOG_MAGIC
+    header["version"] = CATALOG_VERSION
+    header["record_size"] = RECORD_DTYPE.itemsize
+    header["count"] = len(records)
+    header["max_eccentricity"] = records["eccentricity"].max(initial=0)
+    header["max_inclination"] = np.arccos(
+        np.abs(np.cos(records["inclination"].astype(float))).min(initial=1)
+    )
+    with open(path, "wb") as catalog_file:
+        header.tofile(catalog_file)
+        records.tofile(catalog_file)
+
+
+# Distances in AU placed on the scene's scale
+def scene_distance(au):
+    au = np.asarray(au, dtype=float)
+    anchor_au, anchor_distance = np.array(SCENE_DISTANCES, dtype=float).T
+    return np.where(
+        au > anchor_au[-1],
+        au * (anchor_distance[-1] / anchor_au[-1]),
+        np.interp(au, anchor_au, anchor_distance),
+    )
+
+
+# Build catalog records from orbital elements in AU and degrees. The mean
+# motion follows Kepler's third law, scaled to the scene's Earth.
+def records_from_elements(columns, earth_mean_motion=EARTH_MEAN_MOTION):
+    count = len(columns["semi_major_axis"])
+    records = np.zeros(count, dtype=RECORD_DTYPE)
+    semi_major_axis = np.asarray(columns["semi_major_axis"], dtype=float)
+    records["semi_major_axis"] = scene_distance(semi_major_axis)
+    records["eccentricity"] = columns["eccentricity"]
+    for column in ANGLE_COLUMNS:
+        records[column] = np.radians(np.asarray(columns[column], dtype=float))
+    records["mean_motion"] = earth_mean_motion * semi_major_axis**-1.5
+    records["radius"] = columns.get("radius", DEFAULT_RADIUS)
+    return records
+
+
+def read_body_list(path):
+    if path.endswith(".json"):
+        with open(path) as body_file:
+            rows = json.load(body_file)
+    else:
+        with open(path, newline="") as body_file:
+            rows = list(csv.DictReader(body_file))
+    missing = [column for column in REQUIRED_COLUMNS if rows and column not in rows[0]]
+    if missing:
+        raise ValueError(f"{path} is missing columns: {', '.join(missing)}")
+    columns = {
+        column: [float(row[column]) for row in rows] for column in REQUIRED_COLUMNS
+    }
+    if rows and "radius" in rows[0]:
+        columns["radius"] = [float(row["radius"]) for row in rows]
+    return columns
+
+
+def convert(source, destination, earth_mean_motion):
+    records = records_from_elements(read_body_list(source), earth_mean_motion)
+    write_catalog(destination, records)
+    return len(records)
+
+
+# Random main-belt and Kuiper-belt populations, for trying out large catalogs
+def synthesize(destination, count, earth_mean_motion, seed=None):
+    rng = np.random.default_rng(seed)
+    kuiper_count = count * 3 // 10
+    belt_count = count - kuiper_count
+
+    def population(size, inner, outer, max_eccentricity, max_inclination):
+        return {
+            "semi_major_axis": rng.uniform(inner, outer, size),
+            "eccentricity": rng.uniform(0, max_eccentricity, size),
+            "inclination": rng.uniform(0, max_inclination, size),
+            "ascending_node": rng.uniform(0, 360, size),
+            "argument_of_periapsis": rng.uniform(0, 360, size),
+            "mean_anomaly": rng.uniform(0, 360, size),
+            "radius": rng.uniform(0.5, 3, size),
+        }
+
+    belt = population(belt_count, 2.1, 3.3, 0.3, 20)
+    kuiper = population(kuiper_count, 30, 50, 0.25, 30)
+    columns = {
+        column: np.concatenate((belt[column], kuiper[column])) for column in belt
+    }
+    write_catalog(destination, records_from_elements(columns, earth_mean_motion))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build binary minor-body catalogs for the solar system scene"
+    )
+    parser.add_argument(
+        "--earth-mean-motion",
+        type=float,
+        default=EARTH_MEAN_MOTION,
+        help="mean motion at 1 AU in radians per frame",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser(
+        "convert", help="convert a CSV or JSON list of orbital elements"
+    )
+    convert_parser.add_argument("source")
+    convert_parser.add_argument("destination")
+    synthesize_parser = commands.add_parser(
+        "synthesize", help="generate a random catalog"
+    )
+    synthesize_parser.add_argument("destination")
+    synthesize_parser.add_argument("--count", type=int, default=1_000_000)
+    synthesize_parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        count = convert(args.source, args.destination, args.earth_mean_motion)
+        print(f"Wrote {count} bodies to {args.destination}")
+    else:
+        synthesize(
+            args.destination,
+            args.count,
+            args.earth_mean_motion,
+            args.seed,
+        )
+        print(f"Wrote {args.count} bodies to {args.destination}")
@@ -1,7 +1,116 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+
+# pygame's import banner would corrupt a video streamed to stdout by --export -
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
 import pygame
 import math
 import random
+import time
+import numpy as np
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pygame.locals import *
+from catalog import open_catalog
+from snapshot import open_snapshot, write_snapshot
+
+parser = argparse.ArgumentParser(description="Solar System Simulation")
+parser.add_argument(
+    "--catalog",
+    help="minor-body catalog built with catalog.py, drawn instead of the "
+    "randomly generated asteroid and Kuiper belt objects",
+)
+parser.add_argument(
+    "--seed",
+    type=int,
+    help="seed for the randomly generated moons and belt objects, so runs can "
+    "be reproduced",
+)
+parser.add_argument(
+    "--snapshot",
+    help="resume from a snapshot file (also the file S saves to)",
+)
+parser.add_argument(
+    "--sim-rate",
+    type=float,
+    default=60,
+    help="simulation steps per second of real time (default: %(default)s)",
+)
+parser.add_argument(
+    "--fps",
+    type=int,
+    default=1000,
+    help="maximum rendered frames per second, 0 for no limit (default: %(default)s)",
+)
+parser.add_argument(
+    "--render-scale",
+    type=float,
+    default=1,
+    help="resolution of the world layer as a fraction of the window's, "
+    "traded for speed; text stays sharp (default: %(default)s)",
+)
+parser.add_argument(
+    "--upscale",
+    choices=("fast", "smooth"),
+    default="fast",
+    help="filter enlarging the world layer: fast repeats pixels, smooth is "
+    "bilinear but slower (default: %(default)s)",
+)
+parser.add_argument(
+    "--trace",
+    help="write the profiler's per-stage frame timings to this file on exit, "
+    "as Chrome trace-event JSON (also written by Shift+P)",
+)
+parser.add_argument(
+    "--export",
+    metavar="PATH",
+    help="render frames headlessly instead of opening a window: a .y4m video "
+    "('-' for a Y4M stream on stdout) or a directory for a PNG sequence",
+)
+parser.add_argument(
+    "--frames", type=int, default=600, help="frames to export (default: %(default)s)"
+)
+parser.add_argument(
+    "--start-frame",
+    type=float,
+    help="simulation frame of the first exported frame (default: the "
+    "snapshot's frame, or 0)",
+)
+parser.add_argument(
+    "--frame-step",
+    type=float,
+    default=1,
+    help="simulation frames between exported frames (default: %(default)s)",
+)
+parser.add_argument(
+    "--video-fps",
+    type=int,
+    default=60,
+    help="frame rate written to Y4M headers (default: %(default)s)",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=os.cpu_count(),
+    help="export processes (default: one per CPU)",
+)
+args = parser.parse_args()
+if not 0 < args.render_scale <= 1:
+    parser.error("--render-scale must be greater than 0 and at most 1")
+
+snapshot = open_snapshot(args.snapshot) if args.snapshot else None
+if snapshot and not args.catalog:  # Resume with the catalog it was saved with
+    args.catalog = snapshot.state["catalog"]
+
+if args.export:
+    # Render offscreen; must be set before the display is initialized
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
 
 # Initialize pygame
 pygame.init()
@@ -24,6 +133,16 @@ PLANET_COLORS = {  # Colors for planets
 
 # Initialize Pygame display
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
+# The world (background, belts, bodies) is drawn into its own layer at
+# RENDER_SCALE times the window size, then enlarged onto the screen. Text and
+# overlays are drawn on the screen at full resolution.
+RENDER_SCALE = args.render_scale
+VIEW_WIDTH = max(1, round(WIDTH * RENDER_SCALE))  # World layer dimensions
+VIEW_HEIGHT = max(1, round(HEIGHT * RENDER_SCALE))
+if (VIEW_WIDTH, VIEW_HEIGHT) == (WIDTH, HEIGHT):
+    world = screen
+else:
+    world = pygame.Surface((VIEW_WIDTH, VIEW_HEIGHT)).convert()
 pygame.display.set_caption("Solar System Simulation")
 clock = pygame.time.Clock()
 distance_multiplier = 3
@@ -121,7 +240,7 @@ solar_system_data = {
     },
 }
 
-# Constants for elliptical orbits
+# Constants for the dwarf planets
 DWARF_PLANET_COLORS = {
     "Pluto": (190, 178, 174),
     "Eris": (255, 255, 255),
@@ -129,12 +248,18 @@ DWARF_PLANET_COLORS = {
     "Makemake": (239, 222, 205),
 }
 
-# Adjusted constants for more elliptical orbits
+# Keplerian orbital elements for the dwarf planets. The semi-major axes use the
+# simulation scale; eccentricity, inclination, longitude of the ascending node
+# and argument of periapsis are the real values. "angle" is the mean anomaly
+# at frame 0 and "orbital_speed" the mean motion.
 dwarf_planet_data = {
     "Pluto": {
         "radius": 1,
         "semi_major_axis": 700 * distance_multiplier,
-        "semi_minor_axis": 550 * distance_multiplier,
+        "eccentricity": 0.2488,
+        "inclination": math.radians(17.16),
+        "ascending_node": math.radians(110.3),
+        "argument_of_periapsis": math.radians(113.83),
         "angle": 0,
         "color": DWARF_PLANET_COLORS["Pluto"],
         "orbital_speed": 0.00009 * speed_multiplier,
@@ -143,7 +268,10 @@ dwarf_planet_data = {
     "Eris": {
         "radius": 1,
         "semi_major_axis": 800 * distance_multiplier,
-        "semi_minor_axis": 600 * distance_multiplier,
+        "eccentricity": 0.4361,
+        "inclination": math.radians(44.04),
+        "ascending_node": math.radians(35.95),
+        "argument_of_periapsis": math.radians(151.64),
         "angle": 0,
         "color": DWARF_PLANET_COLORS["Eris"],
         "orbital_speed": 0.00008 * speed_multiplier,
@@ -152,7 +280,10 @@ dwarf_planet_data = {
     "Haumea": {
         "radius": 1,
         "semi_major_axis": 850 * distance_multiplier,
-        "semi_minor_axis": 630 * distance_multiplier,
+        "eccentricity": 0.1913,
+        "inclination": math.radians(28.21),
+        "ascending_node": math.radians(122.17),
+        "argument_of_periapsis": math.radians(239.04),
         "angle": 0,
         "color": DWARF_PLANET_COLORS["Haumea"],
         "orbital_speed": 0.00007 * speed_multiplier,
@@ -161,7 +292,10 @@ dwarf_planet_data = {
     "Makemake": {
         "radius": 1,
         "semi_major_axis": 900 * distance_multiplier,
-        "semi_minor_axis": 650 * distance_multiplier,
+        "eccentricity": 0.1559,
+        "inclination": math.radians(28.98),
+        "ascending_node": math.radians(79.62),
+        "argument_of_periapsis": math.radians(294.83),
         "angle": 0,
         "color": DWARF_PLANET_COLORS["Makemake"],
         "orbital_speed": 0.00006 * speed_multiplier,
@@ -192,23 +326,118 @@ planet_info = {
 
 # Constants for the asteroid belt
 ASTEROID_COUNT = 1000  # The number of simulated asteroids - adjust as necessary
+if args.catalog:  # Catalog bodies replace the random ones
+    ASTEROID_COUNT = 0
 INNER_BELT_RADIUS = 115 * distance_multiplier  # Inner radius of the asteroid belt
 OUTER_BELT_RADIUS = 180 * distance_multiplier  # Outer radius of the asteroid belt
 ASTEROID_COLOR = (169, 169, 169)  # Grey color for asteroids
 
+random.seed(args.seed)
+rng = np.random.default_rng(args.seed)
+
+
+# Structure-of-arrays store for a belt of small bodies on circular orbits.
+# Objects are kept sorted by radius so draw_discs can stamp them by size.
+# Orbits are linear in time, so compute() evaluates any frame directly, into
+# back buffers that swap() then brings to the front. The phase is computed in
+# float64 turns and wrapped to [0, 1); positions are computed in float32,
+# where NumPy's vectorized trig is many times faster.
+class Belt:
+    # Arrays describing the orbits, enough to restore the belt from a snapshot
+    ORBIT_ARRAYS = (
+        "radius",
+        "distance",
+        "orbital_speed",
+        "distance32",
+        "turn0",
+        "turn_rate",
+    )
+
+    def __init__(
+        self,
+        count,
+        inner_radius,
+        outer_radius,
+        min_size,
+        max_size,
+        min_speed,
+        max_speed,
+    ):
+        self.radius = np.sort(rng.uniform(min_size, max_size, count)).astype(
+            np.float32
+        )
+        self.distance = rng.uniform(inner_radius, outer_radius, count)
+        angle = rng.uniform(0, 2 * math.pi, count)  # Angle at frame 0
+        self.orbital_speed = rng.uniform(min_speed, max_speed, count) * speed_multiplier
+        self.distance32 = self.distance.astype(np.float32)
+        # Phase at frame 0 and phase change per frame, in turns
+        self.turn0 = angle / (2 * math.pi)
+        self.turn_rate = self.orbital_speed / (2 * math.pi)
+        self.allocate()
+
+    # Allocate the position and scratch buffers for the current orbits
+    def allocate(self):
+        count = len(self.radius)
+        self.x = np.zeros(count, dtype=np.float32)
+        self.y = np.zeros(count, dtype=np.float32)
+        self.back = (
+            np.zeros(count, dtype=np.float32),
+            np.zeros(count, dtype=np.float32),
+        )
+        # Scratch buffers, so a frame allocates no full-size arrays. compute()
+        # and cull_to_viewport() use separate ones, as they can run at once.
+        self.turns = np.empty(count)
+        self.whole_turns = np.empty(count)
+        self.phase = np.empty(count, dtype=np.float32)
+        self.offset = np.empty(count, dtype=np.float32)
+        self.extent = np.empty(count, dtype=np.float32)
+        self.inside = np.empty(count, dtype=bool)
+        self.inside_axis = np.empty(count, dtype=bool)
+
+    def __len__(self):
+        return len(self.radius)
+
+    def compute(self, frame):
+        x, y = self.back
+        np.multiply(self.turn_rate, frame, out=self.turns)
+        self.turns += self.turn0
+        np.floor(self.turns, out=self.whole_turns)
+        self.turns -= self.whole_turns
+        np.copyto(self.phase, self.turns, casting="same_kind")
+        self.phase *= np.float32(2 * math.pi)
+        np.cos(self.phase, out=x)
+        np.sin(self.phase, out=y)
+        x *= self.distance32
+        y *= self.distance32
+
+    def swap(self):
+        front = (self.x, self.y)
+        self.x, self.y = self.back
+        self.back = front
+
+    # Indices of the objects whose bounding box overlaps the window
+    def cull_to_viewport(self, zoom, pan_offset_x, pan_offset_y):
+        zoom = np.float32(zoom)
+        self.inside.fill(True)
+        for coords, pan, half_size in (
+            (self.x, pan_offset_x, VIEW_WIDTH / 2),
+            (self.y, pan_offset_y, VIEW_HEIGHT / 2),
+        ):
+            # |screen position - window center| <= radius + half window size
+            np.multiply(coords, zoom, out=self.offset)
+            self.offset += np.float32(pan - half_size)
+            np.abs(self.offset, out=self.offset)
+            np.multiply(self.radius, zoom, out=self.extent)
+            self.extent += np.float32(half_size)
+            np.less_equal(self.offset, self.extent, out=self.inside_axis)
+            self.inside &= self.inside_axis
+        return np.flatnonzero(self.inside)
+
+
 # Generate random positions for the simulated asteroids in the belt
-asteroid_belt_data = [
-    {
-        "radius": random.uniform(1, 5),  # Random size for visual variety
-        "distance": random.uniform(
-            INNER_BELT_RADIUS, OUTER_BELT_RADIUS
-        ),  # Random orbital range
-        "angle": random.uniform(0, 2 * math.pi),  # Random angle around the sun
-        "orbital_speed": random.uniform(0.0005, 0.0009)
-        * speed_multiplier,  # Random orbital speed
-    }
-    for _ in range(ASTEROID_COUNT)
-]
+asteroid_belt_data = Belt(
+    ASTEROID_COUNT, INNER_BELT_RADIUS, OUTER_BELT_RADIUS, 1, 5, 0.0005, 0.0009
+)
 
 # Random distance and speed range constants
 MIN_MOON_DISTANCE = 10
@@ -264,159 +493,987 @@ solar_system_data.update(generate_moon_data("Saturn", 146))
 solar_system_data.update(generate_moon_data("Jupiter", 95))
 
 
-# Trails for the planets
-planet_trails = {name: [] for name in solar_system_data.keys()}
+KEPLER_TOLERANCE = 1e-10  # Radians of eccentric anomaly
+KEPLER_MAX_ITERATIONS = 30
+
+
+# Solve Kepler's equation M = E - e * sin(E) for the eccentric anomaly E of
+# every orbit at once, with Newton iterations on whole arrays. The arguments
+# broadcast against each other.
+def solve_kepler(mean_anomaly, eccentricity):
+    mean_anomaly = np.remainder(mean_anomaly + math.pi, 2 * math.pi) - math.pi
+    # float32 input cannot get closer than a few ulps to the root
+    tolerance = max(KEPLER_TOLERANCE, 8 * np.finfo(mean_anomaly.dtype).eps)
+    # Start from M + e * sin(M), or from +-pi for very eccentric orbits where
+    # that guess can make Newton's method overshoot
+    eccentric_anomaly = np.where(
+        eccentricity < 0.8,
+        mean_anomaly + eccentricity * np.sin(mean_anomaly),
+        math.pi * np.sign(mean_anomaly),
+    )
+    for _ in range(KEPLER_MAX_ITERATIONS):
+        step = (
+            eccentric_anomaly
+            - eccentricity * np.sin(eccentric_anomaly)
+            - mean_anomaly
+        ) / (1 - eccentricity * np.cos(eccentric_anomaly))
+        eccentric_anomaly -= step
+        if np.max(np.abs(step), initial=0) < tolerance:
+            break
+    return eccentric_anomaly
+
+
+# Keplerian orbits given by (a, e, i, node, periapsis) per body. The rotation
+# from the orbital plane to the ecliptic is precomputed, so positions() only
+# has to solve Kepler's equation for the current mean anomalies. Only the
+# ecliptic x and y are kept, since the scene is drawn from above. Arrays keep
+# their dtype, so float32 elements are solved in (faster) float32.
+class KeplerOrbits:
+    def __init__(
+        self,
+        semi_major_axis,
+        eccentricity,
+        inclination,
+        ascending_node,
+        argument_of_periapsis,
+    ):
+        self.semi_major_axis = np.asarray(semi_major_axis)
+        self.eccentricity = np.asarray(eccentricity)
+        self.semi_minor_axis = self.semi_major_axis * np.sqrt(
+            1 - self.eccentricity**2
+        )
+        cos_node, sin_node = np.cos(ascending_node), np.sin(ascending_node)
+        cos_peri = np.cos(argument_of_periapsis)
+        sin_peri = np.sin(argument_of_periapsis)
+        cos_incl = np.cos(inclination)
+        # Ecliptic x and y of the unit vectors towards periapsis (p) and 90
+        # degrees ahead of it in the orbital plane (q)
+        self.px = cos_node * cos_peri - sin_node * sin_peri * cos_incl
+        self.py = sin_node * cos_peri + cos_node * sin_peri * cos_incl
+        self.qx = -cos_node * sin_peri - sin_node * cos_peri * cos_incl
+        self.qy = -sin_node * sin_peri + cos_node * cos_peri * cos_incl
+
+    def __len__(self):
+        return len(self.semi_major_axis)
+
+    # Positions of the given rows (all by default) relative to the focus.
+    # mean_anomaly has one entry per row, optionally with extra trailing axes
+    # (such as one column per frame), and the result has the same shape.
+    def positions(self, mean_anomaly, rows=slice(None)):
+        mean_anomaly = np.asarray(mean_anomaly)
+        shape = (-1,) + (1,) * (mean_anomaly.ndim - 1)
+
+        def column(values):
+            return values[rows].reshape(shape)
+
+        eccentricity = column(self.eccentricity)
+        eccentric_anomaly = solve_kepler(mean_anomaly, eccentricity)
+        # Position in the orbital plane, then rotated onto the ecliptic
+        along_p = column(self.semi_major_axis) * (
+            np.cos(eccentric_anomaly) - eccentricity
+        )
+        along_q = column(self.semi_minor_axis) * np.sin(eccentric_anomaly)
+        return (
+            along_p * column(self.px) + along_q * column(self.qx),
+            along_p * column(self.py) + along_q * column(self.qy),
+        )
+
+
+ORBITAL_ELEMENTS = (
+    "eccentricity",
+    "inclination",
+    "ascending_node",
+    "argument_of_periapsis",
+)
+
+
+# Structure-of-arrays store for every body in solar_system_data. The per-frame
+# update works on whole columns instead of string-keyed lookups per body.
+# Every orbit is Keplerian: bodies given by "distance" alone are circular,
+# with zero eccentricity and inclination, and their "angle" is the mean
+# anomaly. Bodies with "eccentricity" carry full orbital elements.
+class BodyTable:
+    # Columns defining the bodies, enough to restore them from a snapshot
+    COLUMNS = (
+        "angle0",
+        "orbital_speed",
+        "distance",
+        "radius",
+        "keplerian",
+        "semi_major_axis",
+        *ORBITAL_ELEMENTS,
+        "color_index",
+        "parent",
+    )
+
+    def __init__(self, bodies):
+        self.names = list(bodies.keys())
+        self.index = {name: i for i, name in enumerate(self.names)}
+        rows = list(bodies.values())
+
+        self.angle = np.array([body["angle"] for body in rows], dtype=float)
+        self.angle0 = self.angle.copy()  # Angle at frame 0
+        self.frame = 0.0  # Frame the angles were last evaluated at
+        self.orbital_speed = np.array(
+            [body["orbital_speed"] for body in rows], dtype=float
+        )
+        self.distance = np.array([body["distance"] for body in rows], dtype=float)
+        self.radius = np.array([body["radius"] for body in rows], dtype=float)
+        self.keplerian = np.array(["eccentricity" in body for body in rows])
+        self.semi_major_axis = np.array(
+            [body.get("semi_major_axis", body["distance"]) for body in rows],
+            dtype=float,
+        )
+        for element in ORBITAL_ELEMENTS:
+            setattr(
+                self,
+                element,
+                np.array([body.get(element, 0) for body in rows], dtype=float),
+            )
+        self.update_orbits()
+        self.palette = []
+        self.color_index = np.array(
+            [self.color_to_index(body["color"]) for body in rows], dtype=np.int32
+        )
+        self.parent = np.array(
+            [self.index[body["parent"]] if "parent" in body else -1 for body in rows],
+            dtype=np.int32,
+        )
+        self.update_hierarchy()
+
+        # Heliocentric positions, as of self.frame
+        self.x = np.zeros(len(rows))
+        self.y = np.zeros(len(rows))
+        # Back buffers for (angle, x, y), filled by compute() and then swapped
+        # in, so the next frame can be evaluated while this one is drawn
+        self.back = (np.zeros(len(rows)), np.zeros(len(rows)), np.zeros(len(rows)))
+        self.back_frame = self.frame
+
+    def __len__(self):
+        return len(self.names)
+
+    # Rebuild the orbit engine after the orbital elements have changed
+    def update_orbits(self):
+        self.orbits = KeplerOrbits(
+            self.semi_major_axis,
+            self.eccentricity,
+            self.inclination,
+            self.ascending_node,
+            self.argument_of_periapsis,
+        )
+
+    # Group the bodies by depth below the Sun (planets 0, moons 1, their own
+    # satellites 2, ...), so each level can be placed in one batched gather
+    # from the level above
+    def update_hierarchy(self):
+        self.top_level = np.flatnonzero(self.parent < 0)
+        depth = np.zeros(len(self.parent), dtype=np.int32)
+        ancestor = self.parent.copy()
+        while True:
+            nested = np.flatnonzero(ancestor >= 0)
+            if not len(nested):
+                break
+            depth[nested] += 1
+            ancestor[nested] = self.parent[ancestor[nested]]
+            if depth.max() > len(self.parent):
+                raise ValueError("Body parents form a cycle")
+        self.levels = [np.flatnonzero(depth == d) for d in range(1, depth.max() + 1)]
+
+    # Replace the columns and palette, and rebuild what is derived from them.
+    # The angles and positions follow at the next compute().
+    def restore(self, columns, palette):
+        for column in self.COLUMNS:
+            setattr(self, column, columns[column])
+        self.palette = [tuple(color) for color in palette]
+        self.update_orbits()
+        self.update_hierarchy()
+
+    def color_to_index(self, color):
+        color = tuple(color)
+        if color not in self.palette:
+            self.palette.append(color)
+        return self.palette.index(color)
+
+    # Orbits are linear in time, so any frame is evaluated directly. The
+    # result goes to the back buffers until swap() is called.
+    def compute(self, frame):
+        angle, x, y = self.back
+        np.multiply(self.orbital_speed, frame, out=angle)
+        angle += self.angle0
+        x[:], y[:] = self.orbits.positions(angle)
+        # Satellites orbit around their parent's current position, which is
+        # final once the levels above have been placed
+        for level in self.levels:
+            parents = self.parent[level]
+            x[level] += x[parents]
+            y[level] += y[parents]
+        self.back_frame = frame
+
+    def swap(self):
+        front = (self.angle, self.x, self.y)
+        self.angle, self.x, self.y = self.back
+        self.back = front
+        self.frame = self.back_frame
+
+    # Positions relative to the parent body for the given bodies at each of
+    # the given frames, as two (len(indices), len(frames)) arrays
+    def orbit_positions(self, indices, frames):
+        angle = self.angle0[indices, None] + np.outer(
+            self.orbital_speed[indices], frames
+        )
+        return self.orbits.positions(angle, indices)
+
+
+# Dict-like view of one row of a BodyTable, so code written against the
+# original dict of dicts keeps reading and writing the same values.
+class BodyView(MutableMapping):
+    NUMERIC_KEYS = ("radius", "distance", "angle", "orbital_speed")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.i = index
+
+    def keys_present(self):
+        keys = ["radius", "distance", "angle", "color", "orbital_speed"]
+        if self.table.keplerian[self.i]:
+            keys += ["semi_major_axis", *ORBITAL_ELEMENTS]
+        if self.table.parent[self.i] >= 0:
+            keys.append("parent")
+        return keys
+
+    def __getitem__(self, key):
+        if key not in self.keys_present():
+            raise KeyError(key)
+        if key == "color":
+            return self.table.palette[self.table.color_index[self.i]]
+        if key == "parent":
+            return self.table.names[self.table.parent[self.i]]
+        return getattr(self.table, key)[self.i].item()
+
+    def __setitem__(self, key, value):
+        table, i = self.table, self.i
+        if key == "color":
+            table.color_index[i] = table.color_to_index(value)
+        elif key == "parent":
+            previous = table.parent[i]
+            table.parent[i] = table.index[value]
+            try:
+                table.update_hierarchy()
+            except ValueError:
+                table.parent[i] = previous
+                raise
+        elif key == "semi_major_axis" or key in ORBITAL_ELEMENTS:
+            table.keplerian[i] = True
+            getattr(table, key)[i] = value
+            table.update_orbits()
+        elif key == "angle":
+            table.angle[i] = value
+            table.angle0[i] = value - table.orbital_speed[i] * table.frame
+        elif key == "orbital_speed":
+            # Keep the current angle and continue from it at the new speed
+            table.orbital_speed[i] = value
+            table.angle0[i] = table.angle[i] - value * table.frame
+        elif key in self.NUMERIC_KEYS:
+            getattr(table, key)[i] = value
+            if key == "distance" and not table.keplerian[i]:
+                table.semi_major_axis[i] = value
+                table.update_orbits()
+        else:
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        raise TypeError("body fields cannot be removed")
+
+    def __iter__(self):
+        return iter(self.keys_present())
+
+    def __len__(self):
+        return len(self.keys_present())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+bodies = BodyTable(solar_system_data)
+solar_system_data = {name: BodyView(bodies, i) for i, name in enumerate(bodies.names)}
+
+
+# Preallocated ring buffers holding the trails of several bodies. All trails
+# advance together, so they share one write position. Screen coordinates are
+# cached and only reprojected in bulk when zoom or pan changes; otherwise each
+# append projects just the newest point. After a seek, fill() regenerates the
+# trails analytically.
+class TrailBuffer:
+    def __init__(self, trail_count, length):
+        self.length = length
+        self.world = np.zeros((trail_count, length, 2))
+        self.screen = np.zeros((trail_count, length, 2), dtype=np.int32)
+        self.scratch = np.empty_like(self.world)
+        self.head = 0  # Slot the next point is written to
+        self.count = 0  # Number of valid points in each trail
+        self.view = None  # (zoom, pan_offset_x, pan_offset_y) of self.screen
+
+    def append(self, xs, ys):
+        head = self.head
+        self.world[:, head, 0] = xs
+        self.world[:, head, 1] = ys
+        self.head = (head + 1) % self.length
+        self.count = min(self.count + 1, self.length)
+        if self.view is not None:
+            zoom, pan_offset_x, pan_offset_y = self.view
+            self.screen[:, head] = self.world[:, head] * zoom + (
+                pan_offset_x,
+                pan_offset_y,
+            )
+
+    # Replace every trail with (trail_count, count) arrays of points, count
+    # being at most the buffer length
+    def fill(self, xs, ys):
+        count = xs.shape[1]
+        self.world[:, :count, 0] = xs
+        self.world[:, :count, 1] = ys
+        self.head = count % self.length
+        self.count = count
+        self.view = None
+
+    def project(self, zoom, pan_offset_x, pan_offset_y):
+        view = (zoom, pan_offset_x, pan_offset_y)
+        if view == self.view:
+            return
+        self.view = view
+        np.multiply(self.world, zoom, out=self.scratch)
+        self.scratch += (pan_offset_x, pan_offset_y)
+        self.screen[...] = self.scratch  # Truncates like int()
+
+    # Screen-space points of one trail, oldest first
+    def points(self, row):
+        if self.count < self.length:
+            return self.screen[row, : self.count]
+        return np.concatenate(
+            (self.screen[row, self.head :], self.screen[row, : self.head])
+        )
+
+
 # Initial zoom and pan data
 zoom = 4.0
 pan_offset_x, pan_offset_y = WIDTH / 2, HEIGHT / 2
+
+
+# Zoom and pan of the world layer, as (zoom, pan_offset_x, pan_offset_y)
+def world_view():
+    return zoom * RENDER_SCALE, pan_offset_x * RENDER_SCALE, pan_offset_y * RENDER_SCALE
+
 panning = False
 trail_length = 2000
 
+# Simulation clock. Every orbit is linear in time, so the scene at any frame
+# is evaluated directly instead of stepping through the frames before it.
+# The simulation advances in fixed steps at SIMULATION_RATE per second of real
+# time, however fast frames are rendered; each rendered frame shows the scene
+# between the last two steps, at the fraction of a step left over.
+SIMULATION_RATE = args.sim_rate  # Simulation steps per second
+sim_frame = 0.0  # Simulated frames since the start, as of the last step
+time_scale = 1.0  # Simulated frames per simulation step, negative to rewind
+step_accumulator = 0.0  # Real time not yet simulated, in steps
+render_frame = sim_frame  # Frame the scene is drawn at
+SEEK_FRAMES = 1000  # Frames skipped by the arrow keys, ten times with shift
+SCRUB_FRAMES_PER_PIXEL = 25  # Frames per pixel of right-button dragging
+scrubbing = False
+show_clock = False
+redraw = True  # Set when the scene changes while time is halted
+
+# Trails for the planets, dwarf planets and the Sun, one row per top-level
+# body. A change of parent can move a body into or out of the top level, after
+# which the trails are allocated again for the new set.
+def allocate_trails():
+    global planet_trails, trail_rows
+    planet_trails = TrailBuffer(len(bodies.top_level), trail_length)
+    trail_rows = {index: row for row, index in enumerate(bodies.top_level.tolist())}
+
+
+def trails_outdated():
+    return list(trail_rows) != bodies.top_level.tolist()
+
+
+allocate_trails()
+trail_frame = sim_frame  # Frame of the newest trail point
+
+
+# Bring the trails up to the last simulation step: one point per step during
+# normal playback, otherwise regenerate the last trail_length frames
+# analytically
+def update_trails():
+    global trail_frame
+    step = sim_frame - trail_frame
+    if trails_outdated():
+        fill_trails(sim_frame)
+    elif 0 < time_scale <= 1 and 0 < step <= trail_length * time_scale:
+        steps = round(step / time_scale)
+        frames = trail_frame + time_scale * np.arange(1, steps + 1)
+        xs, ys = bodies.orbit_positions(bodies.top_level, frames)
+        for column in range(steps):
+            planet_trails.append(xs[:, column], ys[:, column])
+    elif step != 0:
+        fill_trails(sim_frame)
+    trail_frame = sim_frame
+    planet_trails.project(*world_view())
+
+
+# Regenerate the trails as the count frames up to the given one
+def fill_trails(frame, count=trail_length):
+    if trails_outdated():
+        allocate_trails()
+    frames = frame - np.arange(count - 1, -1, -1)
+    planet_trails.fill(*bodies.orbit_positions(bodies.top_level, frames))
+
+
+# Look a key up in an LRU cache, creating and storing the value on a miss
+def lru_get(cache, key, limit, create):
+    if key in cache:
+        cache.move_to_end(key)
+    else:
+        cache[key] = create()
+        if len(cache) > limit:
+            cache.popitem(last=False)
+    return cache[key]
+
+
+RING_ZOOM_STEP = 1.01  # Ring sprites are rendered for zoom levels this far apart
+RING_CACHE_SIZE = 24  # Ring sprites kept, a few zoom levels for each planet
+RING_SPRITE_MAX_SIZE = 512  # Larger rings are drawn straight onto the screen
+RING_PROFILE_SAMPLES = 8  # Radial profile samples per pixel in ring sprites
+
+# Ring bands as (inner radius, outer radius, RGBA color) in planet radii.
+# Bands narrower than a pixel are still drawn one pixel wide.
+RING_SYSTEMS = {
+    "Saturn": [
+        (1.24, 1.53, (180, 170, 150, 90)),  # C ring
+        (1.53, 1.95, (235, 225, 200, 210)),  # B ring
+        # The Cassini division separates the B and A rings
+        (2.03, 2.21, (215, 205, 180, 160)),  # A ring, up to the Encke gap
+        (2.22, 2.27, (215, 205, 180, 160)),  # A ring, beyond the Encke gap
+    ],
+    "Uranus": [
+        (11 / 6, 11 / 6, (255, 255, 255, 255)),
+        (12 / 6, 12 / 6, (255, 255, 255, 255)),
+    ],
+    "Neptune": [(10 / 6, 10 / 6, (255, 255, 255, 255))],
+}
 
-def draw_rings(planet, thickness, inner_radius, outer_radius):
-    center_x, center_y = planet["distance"] * math.cos(planet["angle"]), planet[
-        "distance"
-    ] * math.sin(planet["angle"])
-    center_x = center_x * zoom + pan_offset_x
-    center_y = center_y * zoom + pan_offset_y
-
-    for radius in range(inner_radius, outer_radius, thickness):
-        # Apply the zoom factor to the radius, thickness remains unchanged as it's a pixel value
-        pygame.draw.circle(
-            screen,
-            (255, 255, 255),
-            (int(center_x), int(center_y)),
-            int(radius * zoom),
-            thickness,
-        )
+ring_sprites = OrderedDict()  # (planet, zoom bucket, radius) -> sprite, LRU
+# Rings too large for a sprite are drawn into this layer and blended from it;
+# it is kept clear outside of the rings being drawn
+ring_layer = pygame.Surface((VIEW_WIDTH, VIEW_HEIGHT), pygame.SRCALPHA)
+
+
+# Band edges in pixels for a planet of the given on-screen radius
+def ring_band_edges(bands, planet_radius):
+    for inner, outer, color in bands:
+        inner *= planet_radius
+        yield inner, max(outer * planet_radius, inner + 1), color
+
+
+# Render a ring system around a planet of the given on-screen radius into an
+# alpha sprite centered on the planet. The bands are resolved once into a
+# radial color profile that every pixel looks up, so the cost does not grow
+# with the number of bands. Rings are symmetric, so one quadrant is computed
+# and mirrored into the other three.
+def render_ring_sprite(bands, planet_radius):
+    edges = list(ring_band_edges(bands, planet_radius))
+    extent = math.ceil(max(outer for _, outer, _ in edges)) + 1
+    # The quadrant's far corner is extent * sqrt(2) from the center
+    samples = np.arange(math.ceil(extent * 1.5 * RING_PROFILE_SAMPLES)) + 0.5
+    distance = samples / RING_PROFILE_SAMPLES
+    alpha = np.zeros(len(distance))
+    color_sum = np.zeros((len(distance), 3))
+    for inner, outer, color in edges:
+        # Overlap of the band with a pixel's radial span, for antialiasing
+        coverage = np.minimum(outer, distance + 0.5) - np.maximum(inner, distance - 0.5)
+        coverage = np.clip(coverage, 0, 1) * color[3] / 255
+        alpha += coverage
+        color_sum += coverage[:, None] * color[:3]
+    profile = np.empty((len(distance), 4), dtype=np.uint8)
+    profile[:, :3] = color_sum / np.maximum(alpha, 1e-6)[:, None]
+    profile[:, 3] = np.minimum(alpha, 1) * 255
+
+    offsets = np.arange(extent, dtype=np.float32) + 0.5  # Pixel centers
+    sample = np.hypot(offsets[:, None], offsets[None, :])
+    sample *= RING_PROFILE_SAMPLES
+    half = profile[sample.astype(np.intp)]
+    half = np.concatenate((half[::-1], half), axis=0)
+    pixels = np.concatenate((half[:, ::-1], half), axis=1)
+    # The image is symmetric, so row and column order need no care here
+    size = (2 * extent, 2 * extent)
+    return pygame.image.frombytes(pixels.tobytes(), size, "RGBA").convert_alpha()
+
+
+# Draw a planet's rings from a sprite cached for the current zoom bucket, or
+# when zoomed in so far that rendering the sprite would stall a frame, as
+# translucent circles drawn straight into a layer that is then blended in.
+# Past the sprite size their missing antialiasing is a fraction of a band.
+def draw_rings(screen, name, pan_offset_x, pan_offset_y, zoom):
+    index = bodies.index[name]
+    radius = bodies.radius[index]
+    center_x = bodies.x[index] * zoom + pan_offset_x
+    center_y = bodies.y[index] * zoom + pan_offset_y
+    bands = RING_SYSTEMS[name]
+    extent = max(outer for _, outer, _ in bands) * radius * zoom + 1
+    if (
+        center_x + extent < 0
+        or center_x - extent >= VIEW_WIDTH
+        or center_y + extent < 0
+        or center_y - extent >= VIEW_HEIGHT
+    ):
+        return
+
+    if 2 * extent > RING_SPRITE_MAX_SIZE:
+        area = None
+        for inner, outer, color in ring_band_edges(bands, radius * zoom):
+            # Drawing onto an alpha surface stores the color's alpha as it is
+            band = pygame.draw.circle(
+                ring_layer,
+                color,
+                (round(center_x), round(center_y)),
+                round(outer),
+                max(1, round(outer - inner)),
+            )
+            area = band if area is None else area.union(band)
+        screen.blit(ring_layer, area, area)
+        ring_layer.fill((0, 0, 0, 0), area)
+        return
+
+    bucket = round(math.log(zoom, RING_ZOOM_STEP))
+    sprite = lru_get(
+        ring_sprites,
+        (name, bucket, radius),
+        RING_CACHE_SIZE,
+        lambda: render_ring_sprite(bands, radius * RING_ZOOM_STEP**bucket),
+    )
+    half = sprite.get_width() // 2
+    screen.blit(sprite, (round(center_x) - half, round(center_y) - half))
 
 
 # Function to draw a planet and its trail
-def draw_planet(planet, trail):
-    # Check if the planet has an elliptical orbit
-    if "semi_major_axis" in planet and "semi_minor_axis" in planet:
-        # Calculate position on the ellipse using the parametric equations
-        real_x = planet["semi_major_axis"] * math.cos(planet["angle"])
-        real_y = planet["semi_minor_axis"] * math.sin(planet["angle"])
-    else:
-        # Circular orbit
-        real_x = planet["distance"] * math.cos(planet["angle"])
-        real_y = planet["distance"] * math.sin(planet["angle"])
-
+def draw_planet(
+    screen, planet, trail_points, real_x, real_y, pan_offset_x, pan_offset_y, zoom
+):
     x = real_x * zoom + pan_offset_x
     y = real_y * zoom + pan_offset_y
     px, py = int(x), int(y)
 
     pygame.draw.circle(screen, planet["color"], (px, py), int(planet["radius"] * zoom))
 
-    trail.append((real_x, real_y))
-    if len(trail) > trail_length:
-        del trail[0]
-
-    trail_with_zoom_pan = [
-        (int(point[0] * zoom + pan_offset_x), int(point[1] * zoom + pan_offset_y))
-        for point in trail
-    ]
-    if len(trail_with_zoom_pan) > 1:
-        pygame.draw.lines(screen, TRAIL_COLOR, False, trail_with_zoom_pan, 1)
+    # The trail ends at the last simulation step, the planet may be ahead of it
+    trail_points = np.concatenate((trail_points, [(px, py)]))
+    if len(trail_points) > 1:
+        pygame.draw.lines(screen, TRAIL_COLOR, False, trail_points, 1)
+
+
+DISC_STAMP_CHUNK = 1 << 20  # Max pixel writes per stamping pass in draw_discs
+LARGE_DISC_RADIUS = 24  # Discs bigger than this go through pygame.draw.circle
+DISC_DILATE_SHARE = 0.5  # Runs writing more pixels than this share of their box dilate
+disc_offsets = {}  # Pixel offsets covering a filled disc, by radius
+
+
+def get_disc_offsets(radius):
+    if radius not in disc_offsets:
+        span = np.arange(-radius, radius + 1)
+        dx, dy = np.meshgrid(span, span, indexing="ij")
+        inside = dx * dx + dy * dy <= radius * radius
+        disc_offsets[radius] = (dx[inside], dy[inside])
+    return disc_offsets[radius]
+
+
+# The pixels within radius of any marked pixel of a 2D boolean array, for
+# the same disc shape as get_disc_offsets(). Marks are first widened along
+# the second axis by every half-width the disc has, then each widening is
+# OR-ed in at the offsets along the first axis that use it.
+def dilate_disc(marks, radius):
+    widened = [marks]
+    for _ in range(radius):
+        wider = widened[-1].copy()
+        wider[:, 1:] |= widened[-1][:, :-1]
+        wider[:, :-1] |= widened[-1][:, 1:]
+        widened.append(wider)
+    disc = widened[radius].copy()  # The row through the center
+    for dx in range(1, radius + 1):
+        half_width = math.isqrt(radius * radius - dx * dx)
+        disc[dx:] |= widened[half_width][:-dx]
+        disc[:-dx] |= widened[half_width][dx:]
+    return disc
+
+
+# Rasterize many filled discs of one color at once. xs, ys and radii are
+# integer pixel arrays; radii must be sorted in ascending order. A run of
+# equal radii crowded enough that its stamps would write more pixels than
+# DISC_DILATE_SHARE of its bounding box, as in a dense belt, is drawn by
+# dilating its centers within that box instead.
+def draw_discs(surface, xs, ys, radii, color):
+    width, height = surface.get_size()
+
+    # A few big discs are cheaper to draw one by one than to stamp
+    large = np.searchsorted(radii, LARGE_DISC_RADIUS, side="right")
+    for x, y, r in zip(
+        xs[large:].tolist(), ys[large:].tolist(), radii[large:].tolist()
+    ):
+        pygame.draw.circle(surface, color, (x, y), r)
+
+    # pygame draws nothing for a radius of zero, so skip those as well
+    first = np.searchsorted(radii, 1)
+    xs, ys, radii = xs[first:large], ys[first:large], radii[first:large]
+    if not len(radii):
+        return
+
+    mapped_color = surface.map_rgb(color)
+    pixels = pygame.surfarray.pixels2d(surface)
+    # Stamp each run of equal radii with that radius' precomputed disc offsets.
+    # Dilated runs are gathered in one mask and written together at the end.
+    covered = None
+    run_starts = np.flatnonzero(np.diff(radii)) + 1
+    for start, end in zip(
+        np.concatenate(([0], run_starts)), np.concatenate((run_starts, [len(radii)]))
+    ):
+        radius = int(radii[start])
+        dx, dy = get_disc_offsets(radius)
+        run_xs, run_ys = xs[start:end], ys[start:end]
+        # The run's bounding box, padded by the radius and clipped to the surface
+        left = max(int(run_xs.min()) - radius, 0)
+        top = max(int(run_ys.min()) - radius, 0)
+        right = min(int(run_xs.max()) + radius + 1, width)
+        bottom = min(int(run_ys.max()) + radius + 1, height)
+        if left >= right or top >= bottom:
+            continue
+        area = (right - left) * (bottom - top)
+        if (end - start) * len(dx) > DISC_DILATE_SHARE * area:
+            # Mark the centers in the box padded by the radius once more, so
+            # centers just outside the surface still reach into it
+            marks = np.zeros(
+                (right - left + 2 * radius, bottom - top + 2 * radius), dtype=bool
+            )
+            mark_x = run_xs - (left - radius)
+            mark_y = run_ys - (top - radius)
+            inside = (mark_x >= 0) & (mark_x < marks.shape[0])
+            inside &= (mark_y >= 0) & (mark_y < marks.shape[1])
+            marks[mark_x[inside], mark_y[inside]] = True
+            disc = dilate_disc(marks, radius)[radius:-radius, radius:-radius]
+            if covered is None:
+                covered = np.zeros((width, height), dtype=bool)
+                covered_box = [left, top, right, bottom]
+            covered[left:right, top:bottom] |= disc
+            covered_box = [
+                min(left, covered_box[0]),
+                min(top, covered_box[1]),
+                max(right, covered_box[2]),
+                max(bottom, covered_box[3]),
+            ]
+            continue
+        step = max(1, DISC_STAMP_CHUNK // len(dx))
+        for chunk in range(start, end, step):
+            chunk_end = min(end, chunk + step)
+            px = (xs[chunk:chunk_end, None] + dx).ravel()
+            py = (ys[chunk:chunk_end, None] + dy).ravel()
+            inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+            pixels[px[inside], py[inside]] = mapped_color
+    if covered is not None:
+        left, top, right, bottom = covered_box
+        box = (slice(left, right), slice(top, bottom))
+        pixels[box][covered[box]] = mapped_color
+    del pixels  # Unlock the surface
+
+
+LOD_PIXEL_RADIUS = 1  # Smaller bodies are splatted into a density map instead
+DENSE_BLEND_SHARE = 0.25  # Touched share of the bounding box blended densely
+
+
+# Per-pixel coverage of bodies too small to draw as discs. Each body adds the
+# fraction of a pixel its disc would cover, so a pixel holding one body at the
+# threshold size ends up fully colored, just like the smallest stamped disc.
+# Only the box around the touched cells is read back and cleared: densely
+# when the bodies crowd it, otherwise one touched cell at a time.
+class DensityMap:
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.coverage = np.zeros(width * height, dtype=np.float32)
+        # Index of a cell's last entry in the touched list, to drop repeats
+        self.last_entry = np.zeros(width * height, dtype=np.intp)
+        self.cells = []
+        self.box = None  # Touched columns and rows, as (left, top, right, bottom)
+
+    def add(self, xs, ys, radii):
+        # Negative coordinates wrap to huge unsigned ones, failing the test too
+        inside = xs.view(np.uint32) < self.width
+        inside &= ys.view(np.uint32) < self.height
+        xs, ys = xs[inside], ys[inside]
+        if not len(xs):
+            return
+        cells = xs * self.height + ys
+        np.add.at(self.coverage, cells, np.float32(math.pi) * radii[inside] ** 2)
+        self.cells.append(cells)
+        box = (xs.min(), ys.min(), xs.max() + 1, ys.max() + 1)
+        if self.box is not None:
+            box = (*map(min, box[:2], self.box[:2]), *map(max, box[2:], self.box[2:]))
+        self.box = box
+
+    # Colormap the accumulated coverage onto the surface, then reset
+    def composite(self, surface, color):
+        if not self.cells:
+            return
+        cells = np.concatenate(self.cells)
+        self.cells.clear()
+        left, top, right, bottom = self.box
+        self.box = None
+        color = np.array(color, dtype=np.float32)
+        pixels = pygame.surfarray.pixels3d(surface)
+        if len(cells) >= DENSE_BLEND_SHARE * (right - left) * (bottom - top):
+            coverage = self.coverage.reshape(self.width, self.height)
+            coverage = coverage[left:right, top:bottom]
+            alpha = np.minimum(coverage, 1)[:, :, None]
+            block = pixels[left:right, top:bottom]
+            under = block.astype(np.float32)
+            under += (color - under) * alpha
+            block[...] = under  # Truncates like astype(np.uint8)
+            coverage.fill(0)
+        else:
+            entries = np.arange(len(cells))
+            self.last_entry[cells] = entries
+            cells = cells[self.last_entry[cells] == entries]
+            alpha = np.minimum(self.coverage[cells], 1)[:, None]
+            self.coverage[cells] = 0
+            x, y = np.divmod(cells, self.height)
+            under = pixels[x, y].astype(np.float32)
+            under += (color - under) * alpha
+            pixels[x, y] = under.astype(np.uint8)
+        del pixels  # Unlock the surface
+
+
+density_map = DensityMap(VIEW_WIDTH, VIEW_HEIGHT)
+
+
+# Draw bodies given in float screen space, with radii sorted in ascending
+# order. Each body is stamped as a disc or splatted into density_map
+# depending on its own size on screen, so zooming moves bodies across the
+# threshold one at a time rather than switching the whole belt at once. The
+# caller composites density_map once all bodies of the color are in.
+def draw_small_bodies(surface, screen_x, screen_y, screen_radius, color):
+    split = np.searchsorted(screen_radius, LOD_PIXEL_RADIUS)
+    xs = screen_x.astype(np.int32)
+    ys = screen_y.astype(np.int32)
+    density_map.add(xs[:split], ys[:split], screen_radius[:split])
+    draw_discs(
+        surface,
+        xs[split:],
+        ys[split:],
+        screen_radius[split:].astype(np.int32),
+        color,
+    )
 
 
-def draw_asteroid_belt(
-    screen, pan_offset_x, pan_offset_y, zoom, inner_radius, outer_radius
+# Project a belt to the screen, cull it to the viewport and draw it. Returns
+# the drawn objects' indices and screen positions and radii.
+def draw_belt_objects(screen, belt, color, pan_offset_x, pan_offset_y, zoom):
+    visible = belt.cull_to_viewport(zoom, pan_offset_x, pan_offset_y)
+    zoom = np.float32(zoom)
+    screen_x = belt.x[visible] * zoom + np.float32(pan_offset_x)
+    screen_y = belt.y[visible] * zoom + np.float32(pan_offset_y)
+    screen_radius = belt.radius[visible] * zoom
+    draw_small_bodies(screen, screen_x, screen_y, screen_radius, color)
+    density_map.composite(screen, color)
+    return visible, screen_x, screen_y, screen_radius
+
+
+# Fill the ring between two radii, clipped to the surface. Only the rows
+# that cross both the ring and the clip area are visited, each as at most two
+# horizontal spans, so the cost follows the pixels covered rather than the
+# radius. Pixels are filled when their center lies within the ring. Returns
+# the rectangle bounding the filled pixels, like the pygame.draw functions.
+def fill_annulus(surface, color, center, inner_radius, outer_radius):
+    center_x, center_y = center
+    clip = surface.get_clip()
+    top = max(clip.top, math.ceil(center_y - outer_radius - 0.5))
+    bottom = min(clip.bottom, math.floor(center_y + outer_radius - 0.5) + 1)
+    bounds = pygame.Rect(clip.left, top, 0, 0)
+    if top >= bottom:
+        return bounds
+    dy = np.arange(top, bottom) + 0.5 - center_y
+    outer = np.sqrt(np.maximum(outer_radius**2 - dy**2, 0))
+    hole = inner_radius**2 - dy**2
+    inner = np.sqrt(np.maximum(hole, 0))
+    spans = zip(
+        range(top, bottom),
+        np.ceil(center_x - outer - 0.5).tolist(),
+        np.floor(center_x - inner - 0.5).tolist(),
+        np.ceil(center_x + inner - 0.5).tolist(),
+        np.floor(center_x + outer - 0.5).tolist(),
+        (hole > 0).tolist(),
+    )
+    for y, left, left_end, right_start, right, has_hole in spans:
+        if has_hole:
+            row_spans = ((left, left_end), (right_start, right))
+        else:
+            row_spans = ((left, right),)
+        for start, end in row_spans:
+            start = max(start, clip.left)
+            end = min(end + 1, clip.right)
+            if start < end:
+                span = surface.fill(color, (start, y, end - start, 1))
+                bounds = bounds.union(span) if bounds.width else span
+    return bounds
+
+
+def draw_asteroid_belt_tint(
+    tint_surface, pan_offset_x, pan_offset_y, zoom, inner_radius, outer_radius
 ):
-    # Create a new Surface with per-pixel alpha to draw the semi-transparent circle
-    belt_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-
-    # Generate points for the inner and outer edges of the asteroid belt
-    inner_edge_points = []
-    outer_edge_points = []
-    # Draw for a bit more than 360 degrees for overlap
-    for angle in range(0, 361, 1):  # Go up to 361 for a slight overlap
-        rad_angle = math.radians(angle)
-        inner_x = pan_offset_x + int(math.cos(rad_angle) * inner_radius * zoom)
-        inner_y = pan_offset_y + int(math.sin(rad_angle) * inner_radius * zoom)
-        inner_edge_points.append((inner_x, inner_y))
-
-    for angle in range(360, -1, -1):  # Go in reverse for outer edge.
-        rad_angle = math.radians(angle)
-        outer_x = pan_offset_x + int(math.cos(rad_angle) * outer_radius * zoom)
-        outer_y = pan_offset_y + int(math.sin(rad_angle) * outer_radius * zoom)
-        outer_edge_points.append((outer_x, outer_y))
-
-    # Combine the edge points and draw the polygon for the belt
-    all_points = inner_edge_points + outer_edge_points
-    pygame.draw.polygon(belt_surface, RED_TINT_COLOR + (128,), all_points)
-
-    # Blit this surface onto the main screen surface
-    screen.blit(belt_surface, (0, 0))
+    return fill_annulus(
+        tint_surface,
+        RED_TINT_COLOR + (128,),
+        (pan_offset_x, pan_offset_y),
+        inner_radius * zoom,
+        outer_radius * zoom,
+    )
 
+
+def draw_asteroid_belt(screen, pan_offset_x, pan_offset_y, zoom):
     # Draw the asteroids on the main screen surface
-    for asteroid in asteroid_belt_data:
-        real_x = asteroid["distance"] * math.cos(asteroid["angle"])
-        real_y = asteroid["distance"] * math.sin(asteroid["angle"])
-        x = real_x * zoom + pan_offset_x
-        y = real_y * zoom + pan_offset_y
-        if 0 <= x < WIDTH and 0 <= y < HEIGHT:
-            pygame.draw.circle(
-                screen, ASTEROID_COLOR, (int(x), int(y)), int(asteroid["radius"] * zoom)
-            )
+    return draw_belt_objects(
+        screen, asteroid_belt_data, ASTEROID_COLOR, pan_offset_x, pan_offset_y, zoom
+    )
 
 
 # Kuiper belt objects
 KUIPER_OBJECT_COUNT = 5000  # Number of objects (comets/asteroids) in the Kuiper Belt
 KUIPER_OBJECT_COLOR = (255, 255, 255)  # White color for comets/asteroids
+if args.catalog:  # Catalog bodies replace the random ones
+    KUIPER_OBJECT_COUNT = 0
 
 # Generate random positions for the simulated asteroids and comets in the Kuiper Belt
-kuiper_objects_data = [
-    {
-        "radius": random.uniform(3, 5),  # Random size for visual variety
-        "distance": random.uniform(KUIPER_BELT_INNER_RADIUS, KUIPER_BELT_OUTER_RADIUS),
-        "angle": random.uniform(0, 2 * math.pi),
-        "orbital_speed": random.uniform(0.0002, 0.0004) * speed_multiplier,
-        "color": KUIPER_OBJECT_COLOR
-        if random.random() > 0.5
-        else (0, 0, 255),  # Half will be blue for comets
-    }
-    for _ in range(KUIPER_OBJECT_COUNT)
-]
-
-
-def draw_kuiper_belt(screen, pan_offset_x, pan_offset_y, zoom):
-    kuiper_belt_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-
+kuiper_objects_data = Belt(
+    KUIPER_OBJECT_COUNT,
+    KUIPER_BELT_INNER_RADIUS,
+    KUIPER_BELT_OUTER_RADIUS,
+    3,
+    5,
+    0.0002,
+    0.0004,
+)
+
+
+def draw_kuiper_belt_tint(tint_surface, pan_offset_x, pan_offset_y, zoom):
     # Fill the region between the inner and outer radius with a green tint
-    pygame.draw.circle(
-        kuiper_belt_surface,
+    return fill_annulus(
+        tint_surface,
         KUIPER_BELT_COLOR,
-        (int(pan_offset_x), int(pan_offset_y)),
-        int(KUIPER_BELT_OUTER_RADIUS * zoom),
-    )
-    pygame.draw.circle(
-        kuiper_belt_surface,
-        DARK_GREY + (0,),  # Same as background color to 'erase' inner circle
-        (int(pan_offset_x), int(pan_offset_y)),
-        int(KUIPER_BELT_INNER_RADIUS * zoom),
+        (pan_offset_x, pan_offset_y),
+        KUIPER_BELT_INNER_RADIUS * zoom,
+        KUIPER_BELT_OUTER_RADIUS * zoom,
     )
 
-    # Blit this Surface onto the main screen Surface
-    screen.blit(kuiper_belt_surface, (0, 0))
 
+def draw_kuiper_belt(screen, pan_offset_x, pan_offset_y, zoom):
     # Draw the icy objects in the Kuiper Belt
-    for obj in kuiper_objects_data:
-        obj_x = obj["distance"] * math.cos(obj["angle"])
-        obj_y = obj["distance"] * math.sin(obj["angle"])
-        screen_x = obj_x * zoom + pan_offset_x
-        screen_y = obj_y * zoom + pan_offset_y
-        pygame.draw.circle(
+    return draw_belt_objects(
+        screen,
+        kuiper_objects_data,
+        KUIPER_OBJECT_COLOR,
+        pan_offset_x,
+        pan_offset_y,
+        zoom,
+    )
+
+
+CATALOG_CHUNK = 1 << 16  # Catalog records materialized together
+CATALOG_CACHE_CHUNKS = 16  # Materialized chunks kept in memory
+CATALOG_BODY_COLOR = (200, 200, 180)
+
+
+# One materialized slice of a catalog, converted to float32 orbits and sorted
+# by radius for draw_discs
+class CatalogChunk:
+    def __init__(self, records):
+        records = records[np.argsort(records["radius"], kind="stable")]
+        self.orbits = KeplerOrbits(
+            records["semi_major_axis"],
+            records["eccentricity"],
+            records["inclination"],
+            records["ascending_node"],
+            records["argument_of_periapsis"],
+        )
+        self.radius = records["radius"].copy()
+        # Mean anomaly in float64 turns, wrapped before dropping to float32
+        self.turn0 = records["mean_anomaly"] / (2 * math.pi)
+        self.turn_rate = records["mean_motion"] / (2 * math.pi)
+
+    def positions(self, frame):
+        turns = self.turn0 + self.turn_rate * frame
+        turns -= np.floor(turns)
+        mean_anomaly = (turns * (2 * math.pi)).astype(np.float32)
+        return self.orbits.positions(mean_anomaly)
+
+
+# Minor bodies read from a memory-mapped catalog. Only the chunks whose
+# semi-major axes can reach the viewport are materialized, and at most
+# CATALOG_CACHE_CHUNKS of them are kept, so memory use does not grow with the
+# size of the catalog.
+class CatalogBodies:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.chunks = OrderedDict()  # Chunk number -> CatalogChunk, oldest first
+
+    def chunk(self, number):
+        if number in self.chunks:
+            self.chunks.move_to_end(number)
+        else:
+            start = number * CATALOG_CHUNK
+            records = self.catalog.records[start : start + CATALOG_CHUNK]
+            self.chunks[number] = CatalogChunk(np.array(records))
+            if len(self.chunks) > CATALOG_CACHE_CHUNKS:
+                self.chunks.popitem(last=False)
+        return self.chunks[number]
+
+    # Chunks holding every body that can be within the viewport
+    def visible_chunks(self, pan_offset_x, pan_offset_y, zoom):
+        # World-space window, then its nearest and farthest points to the Sun
+        left, right = -pan_offset_x / zoom, (VIEW_WIDTH - pan_offset_x) / zoom
+        top, bottom = -pan_offset_y / zoom, (VIEW_HEIGHT - pan_offset_y) / zoom
+        min_distance = math.hypot(
+            min(max(0, left), right), min(max(0, top), bottom)
+        )
+        max_distance = math.hypot(
+            max(abs(left), abs(right)), max(abs(top), abs(bottom))
+        )
+        low, high = self.catalog.index_range(min_distance, max_distance)
+        if low >= high:
+            return []
+        return [
+            self.chunk(number)
+            for number in range(low // CATALOG_CHUNK, (high - 1) // CATALOG_CHUNK + 1)
+        ]
+
+
+def draw_catalog_bodies(
+    screen, catalog_bodies, frame, pan_offset_x, pan_offset_y, zoom
+):
+    for chunk in catalog_bodies.visible_chunks(pan_offset_x, pan_offset_y, zoom):
+        x, y = chunk.positions(frame)
+        screen_x = x * np.float32(zoom) + np.float32(pan_offset_x)
+        screen_y = y * np.float32(zoom) + np.float32(pan_offset_y)
+        screen_radius = chunk.radius * np.float32(zoom)
+        visible = np.flatnonzero(
+            (screen_x + screen_radius >= 0)
+            & (screen_x - screen_radius < VIEW_WIDTH)
+            & (screen_y + screen_radius >= 0)
+            & (screen_y - screen_radius < VIEW_HEIGHT)
+        )
+        draw_small_bodies(
             screen,
-            KUIPER_OBJECT_COLOR,
-            (int(screen_x), int(screen_y)),
-            int(obj["radius"] * zoom),
+            screen_x[visible],
+            screen_y[visible],
+            screen_radius[visible],
+            CATALOG_BODY_COLOR,
         )
+    density_map.composite(screen, CATALOG_BODY_COLOR)
+
 
-    # Update the positions of objects for their orbit
-    for obj in kuiper_objects_data:
-        obj["angle"] += obj["orbital_speed"]
+catalog_bodies = CatalogBodies(open_catalog(args.catalog)) if args.catalog else None
 
 
 # Constants for the termination shock
@@ -429,48 +1486,811 @@ TERMINATION_SHOCK_OUTER_RADIUS = (
 TERMINATION_SHOCK_COLOR = (255, 165, 0, 64)  # Semi-transparent orange color
 
 
-def draw_termination_shock(screen, pan_offset_x, pan_offset_y, zoom):
-    termination_shock_surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-    pygame.draw.circle(
-        termination_shock_surface,
+def draw_termination_shock(tint_surface, pan_offset_x, pan_offset_y, zoom):
+    return fill_annulus(
+        tint_surface,
         TERMINATION_SHOCK_COLOR,
-        (int(pan_offset_x), int(pan_offset_y)),
-        int(TERMINATION_SHOCK_OUTER_RADIUS * zoom),
+        (pan_offset_x, pan_offset_y),
+        TERMINATION_SHOCK_INNER_RADIUS * zoom,
+        TERMINATION_SHOCK_OUTER_RADIUS * zoom,
     )
-    pygame.draw.circle(
-        termination_shock_surface,
-        DARK_GREY + (0,),
-        (int(pan_offset_x), int(pan_offset_y)),
-        int(TERMINATION_SHOCK_INNER_RADIUS * zoom),
+
+
+TINT_LAYER_MARGIN = 400  # Extra pixels rendered around the window for panning
+
+
+# Background with the belt and termination shock tints composited once. The
+# tints only depend on zoom and pan, so the layer is kept until the zoom
+# changes or a pan moves further than the margin rendered around the window;
+# smaller pans are an offset blit of the cached layer.
+class TintLayerCache:
+    def __init__(self):
+        size = (
+            VIEW_WIDTH + 2 * TINT_LAYER_MARGIN,
+            VIEW_HEIGHT + 2 * TINT_LAYER_MARGIN,
+        )
+        self.layer = pygame.Surface(size).convert()
+        self.tint_surface = pygame.Surface(size, pygame.SRCALPHA)
+        self.key = None  # (zoom, pan_offset_x, pan_offset_y) the layer shows
+
+    def invalidate(self):
+        self.key = None
+
+    def covers(self, pan_offset_x, pan_offset_y):
+        _, layer_pan_x, layer_pan_y = self.key
+        return (
+            abs(pan_offset_x - layer_pan_x) <= TINT_LAYER_MARGIN
+            and abs(pan_offset_y - layer_pan_y) <= TINT_LAYER_MARGIN
+        )
+
+    def pan_moved(self, pan_offset_x, pan_offset_y):
+        if self.key is not None and not self.covers(pan_offset_x, pan_offset_y):
+            self.invalidate()
+
+    def render(self, pan_offset_x, pan_offset_y, zoom):
+        center_x = pan_offset_x + TINT_LAYER_MARGIN
+        center_y = pan_offset_y + TINT_LAYER_MARGIN
+        self.layer.fill(DARK_GREY)
+        tints = (
+            (
+                "asteroid belt tint",
+                lambda surface: draw_asteroid_belt_tint(
+                    surface,
+                    center_x,
+                    center_y,
+                    zoom,
+                    INNER_BELT_RADIUS,
+                    OUTER_BELT_RADIUS,
+                ),
+            ),
+            (
+                "kuiper belt tint",
+                lambda surface: draw_kuiper_belt_tint(
+                    surface, center_x, center_y, zoom
+                ),
+            ),
+            (
+                "termination shock",
+                lambda surface: draw_termination_shock(
+                    surface, center_x, center_y, zoom
+                ),
+            ),
+        )
+        # tint_surface is kept clear outside of the area each tint fills
+        for stage, draw_tint in tints:
+            with profiler.stage(stage):
+                area = draw_tint(self.tint_surface)
+                self.layer.blit(self.tint_surface, area, area)
+                self.tint_surface.fill((0, 0, 0, 0), area)
+        self.key = (zoom, pan_offset_x, pan_offset_y)
+
+    def draw(self, screen, pan_offset_x, pan_offset_y, zoom):
+        if (
+            self.key is None
+            or self.key[0] != zoom
+            or not self.covers(pan_offset_x, pan_offset_y)
+        ):
+            self.render(pan_offset_x, pan_offset_y, zoom)
+        _, layer_pan_x, layer_pan_y = self.key
+        screen.blit(
+            self.layer,
+            (
+                int(pan_offset_x - layer_pan_x) - TINT_LAYER_MARGIN,
+                int(pan_offset_y - layer_pan_y) - TINT_LAYER_MARGIN,
+            ),
+        )
+
+
+tint_layers = TintLayerCache()
+
+
+TEXT_SIZE = 24  # Font size for the info boxes and the clock
+TEXT_CACHE_SIZE = 256  # Rendered text surfaces kept
+INFO_PANEL_CACHE_SIZE = 64  # Rendered info boxes kept
+INFO_PANEL_WIDTH = 420  # Info box text is wrapped to this many pixels
+INFO_PANEL_PADDING = 10
+
+fonts = {}  # Size -> loaded font
+text_surfaces = OrderedDict()  # (text, size, color) -> surface, LRU
+info_panels = OrderedDict()  # Info text -> rendered box, LRU
+
+
+def get_font(size):
+    if size not in fonts:
+        fonts[size] = pygame.font.Font(None, size)
+    return fonts[size]
+
+
+def render_text(text, size, color):
+    return lru_get(
+        text_surfaces,
+        (text, size, color),
+        TEXT_CACHE_SIZE,
+        lambda: get_font(size).render(text, True, color),
     )
-    screen.blit(termination_shock_surface, (0, 0))
 
 
-font = pygame.font.Font(None, 24)  # Initialize a font for text rendering
+# Split text into lines that fit within width pixels, breaking at spaces
+def wrap_text(text, font, width):
+    lines = []
+    for word in text.split():
+        if lines and font.size(lines[-1] + " " + word)[0] <= width:
+            lines[-1] += " " + word
+        else:
+            lines.append(word)
+    return lines
+
+
+# White box with the text wrapped to INFO_PANEL_WIDTH
+def render_info_panel(text):
+    font = get_font(TEXT_SIZE)
+    line_surfaces = [
+        render_text(line, TEXT_SIZE, (0, 0, 0))
+        for line in wrap_text(text, font, INFO_PANEL_WIDTH)
+    ]
+    line_height = font.get_linesize()
+    panel = pygame.Surface(
+        (
+            max(line.get_width() for line in line_surfaces) + 2 * INFO_PANEL_PADDING,
+            len(line_surfaces) * line_height + 2 * INFO_PANEL_PADDING,
+        )
+    ).convert()
+    panel.fill((255, 255, 255))
+    for i, line in enumerate(line_surfaces):
+        panel.blit(line, (INFO_PANEL_PADDING, INFO_PANEL_PADDING + i * line_height))
+    return panel
 
 
 def draw_info_box(screen, text, planet_pos, mouse_pos):
-    # Initialize a font for text rendering
-    font = pygame.font.Font(None, 24)
-    # Create a text surface
-    text_surface = font.render(text, True, (0, 0, 0))
-    # Calculate the width and height of the text surface and add some padding
-    text_width, text_height = text_surface.get_size()
-    box_width, box_height = text_width + 20, text_height + 20
-    # Calculate the position of the box
-    box_x = mouse_pos[0] + 20  # Box starts 20 pixels to the right of the cursor
-    box_y = mouse_pos[1]  # Box is aligned with the cursor vertically
+    panel = lru_get(
+        info_panels, text, INFO_PANEL_CACHE_SIZE, lambda: render_info_panel(text)
+    )
     # Draw a line from the planet to the box
-    pygame.draw.line(screen, (255, 255, 255), planet_pos, mouse_pos, 1)
-    # Draw a white rectangle for the box background
-    pygame.draw.rect(screen, (255, 255, 255), (box_x, box_y, box_width, box_height))
-    # Blit the text surface onto the screen at the box position offset by 10 pixels from each border
-    screen.blit(text_surface, (box_x + 10, box_y + 10))
+    line = pygame.draw.line(screen, (255, 255, 255), planet_pos, mouse_pos, 1)
+    # The box starts 20 pixels to the right of the cursor, aligned with it
+    box = screen.blit(panel, (mouse_pos[0] + 20, mouse_pos[1]))
+    return [line, box]
+
+
+HOVER_CELL_SIZE = 32  # Pixels per side of a hover grid cell
+HOVER_MIN_RADIUS = 3  # Tiny bodies can still be hovered within this distance
+
+
+# Screen-space index of everything that can be hovered, rebuilt whenever a
+# frame is drawn. Objects are bucketed by the grid cell of their center and
+# sorted by cell, so the cells around the cursor are found with a binary
+# search. Objects wider than a cell are few and are tested one by one.
+class HoverIndex:
+    def __init__(self):
+        self.columns = WIDTH // HOVER_CELL_SIZE + 3  # One spare cell each side
+        self.rows = HEIGHT // HOVER_CELL_SIZE + 3
+        self.layers = []
+        self.build()
+
+    def add(self, kind, indices, screen_x, screen_y, screen_radius):
+        self.layers.append((kind, indices, screen_x, screen_y, screen_radius))
+
+    def cell_keys(self, cell_x, cell_y):
+        return (cell_x + 1) * self.rows + cell_y + 1
+
+    # Index the layers added since the last build, earlier layers first
+    def build(self):
+        self.kinds = [kind for kind, *_ in self.layers]
+        sizes = [len(indices) for _, indices, *_ in self.layers]
+        layer = np.repeat(np.arange(len(self.layers)), sizes)
+        index, x, y, radius = (
+            np.concatenate([columns[i] for columns in self.layers] + [[]])
+            for i in range(1, 5)
+        )
+        self.layers = []
+        index = index.astype(int)
+        radius = np.maximum(radius, HOVER_MIN_RADIUS)
+        cell_x = np.floor(x / HOVER_CELL_SIZE).astype(int)
+        cell_y = np.floor(y / HOVER_CELL_SIZE).astype(int)
+        large = radius > HOVER_CELL_SIZE
+        # Small objects wholly off screen can never be under the cursor
+        small = np.flatnonzero(
+            ~large
+            & (cell_x >= -1)
+            & (cell_x < self.columns - 1)
+            & (cell_y >= -1)
+            & (cell_y < self.rows - 1)
+        )
+        keys = self.cell_keys(cell_x[small], cell_y[small])
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        small = small[order]
+        self.small = [column[small] for column in (layer, index, x, y, radius)]
+        self.large = [column[large] for column in (layer, index, x, y, radius)]
+
+    # The object under the screen point as (kind, index, (x, y)), or None.
+    # Earlier layers win, then the object whose center is closest.
+    def pick(self, mouse_x, mouse_y):
+        cell_x = mouse_x // HOVER_CELL_SIZE
+        cell_y = mouse_y // HOVER_CELL_SIZE
+        # A column's cells are consecutive keys, so the 3x3 block around the
+        # cursor is three ranges
+        first = self.cell_keys(np.arange(cell_x - 1, cell_x + 2), cell_y - 1)
+        starts = np.searchsorted(self.keys, first)
+        ends = np.searchsorted(self.keys, first + 2, side="right")
+        rows = np.concatenate(
+            [np.arange(start, end) for start, end in zip(starts, ends)]
+        )
+        candidates = [
+            np.concatenate((small[rows], large))
+            for small, large in zip(self.small, self.large)
+        ]
+        layer, index, x, y, radius = candidates
+        distance = np.hypot(x - mouse_x, y - mouse_y)
+        hits = np.flatnonzero(distance <= radius)
+        if not len(hits):
+            return None
+        hit = hits[np.lexsort((distance[hits], layer[hits]))[0]]
+        return self.kinds[layer[hit]], int(index[hit]), (x[hit], y[hit])
+
+
+hover_index = HoverIndex()
+
+
+# Info box text for a hovered object
+def hover_text(kind, index):
+    if kind == "body":
+        name = bodies.names[index]
+        parent = bodies.parent[index]
+        if parent < 0:
+            return planet_info.get(name, "Information not available")
+        period = 2 * math.pi / abs(bodies.orbital_speed[index])
+        return (
+            f"{name.replace('_', ' ')} orbits {bodies.names[parent]} at a distance "
+            f"of {bodies.distance[index]:g} every {period:,.0f} frames."
+        )
+    belt, label = {
+        "asteroid": (asteroid_belt_data, "Asteroid"),
+        "kuiper": (kuiper_objects_data, "Kuiper belt object"),
+    }[kind]
+    period = 2 * math.pi / belt.orbital_speed[index]
+    return (
+        f"{label} {index + 1:,} orbits the Sun at a distance of "
+        f"{belt.distance[index]:,.0f} every {period:,.0f} frames."
+    )
+
+
+def draw_clock(screen):
+    text = f"Frame {int(sim_frame):,}   x{time_scale:g}"
+    # The clock changes every frame, so it is not worth caching
+    text_surface = get_font(TEXT_SIZE).render(text, True, (255, 255, 255))
+    screen.blit(text_surface, (10, HEIGHT - text_surface.get_height() - 10))
+
+
+def seek(frames):
+    global sim_frame, redraw
+    sim_frame += frames
+    redraw = True
+
 
+# Draw the scene at render_frame onto the screen, with the bodies, belts and
+# trails already brought up to it, and index what was drawn for hovering
+def draw_scene():
+    view_zoom, view_x, view_y = world_view()
+    # Clear the world to the cached background with the belt tints
+    with profiler.stage("background"):
+        tint_layers.draw(world, view_x, view_y, view_zoom)
+    # Draw the asteroid belt
+    with profiler.stage("asteroid belt"):
+        drawn_asteroids = draw_asteroid_belt(world, view_x, view_y, view_zoom)
 
-info_box_visible = False
+    # Draw the Kuiper Belt objects
+    with profiler.stage("kuiper belt"):
+        drawn_kuiper_objects = draw_kuiper_belt(world, view_x, view_y, view_zoom)
+
+    if catalog_bodies:
+        with profiler.stage("catalog"):
+            draw_catalog_bodies(
+                world, catalog_bodies, render_frame, view_x, view_y, view_zoom
+            )
+
+    # Draw each planet and their trails
+    with profiler.stage("bodies"):
+        body_screen_x = bodies.x * view_zoom + view_x
+        body_screen_y = bodies.y * view_zoom + view_y
+        body_screen_radius = bodies.radius * view_zoom
+        screen_x = body_screen_x.astype(int).tolist()
+        screen_y = body_screen_y.astype(int).tolist()
+        screen_radius = body_screen_radius.astype(int).tolist()
+        real_x, real_y = bodies.x.tolist(), bodies.y.tolist()
+        is_moon = (bodies.parent >= 0).tolist()
+        for i, name in enumerate(bodies.names):
+            planet_data = solar_system_data[name]
+            if is_moon[i]:
+                pygame.draw.circle(
+                    world,
+                    bodies.palette[bodies.color_index[i]],
+                    (screen_x[i], screen_y[i]),
+                    screen_radius[i],
+                )
+            else:
+                trail_points = planet_trails.points(trail_rows[i])
+                draw_planet(
+                    world,
+                    planet_data,
+                    trail_points,
+                    real_x[i],
+                    real_y[i],
+                    view_x,
+                    view_y,
+                    view_zoom,
+                )
+
+    # Draw rings for Saturn, Uranus and Neptune
+    with profiler.stage("rings"):
+        for name in RING_SYSTEMS:
+            draw_rings(world, name, view_x, view_y, view_zoom)
+
+    if world is not screen:
+        with profiler.stage("upscale"):
+            if args.upscale == "smooth":
+                pygame.transform.smoothscale(world, (WIDTH, HEIGHT), screen)
+            else:
+                pygame.transform.scale(world, (WIDTH, HEIGHT), screen)
+
+    if show_clock:
+        draw_clock(screen)
+
+    # Index what was drawn for hovering, bodies taking precedence, in window
+    # coordinates
+    with profiler.stage("hover index"):
+        drawn_bodies = (
+            np.arange(len(bodies)),
+            body_screen_x,
+            body_screen_y,
+            body_screen_radius,
+        )
+        for kind, (indices, x, y, radius) in (
+            ("body", drawn_bodies),
+            ("asteroid", drawn_asteroids),
+            ("kuiper", drawn_kuiper_objects),
+        ):
+            hover_index.add(
+                kind, indices, x / RENDER_SCALE, y / RENDER_SCALE, radius / RENDER_SCALE
+            )
+        hover_index.build()
+
+
+# Double-buffered scene state. After a frame is drawn, a worker thread
+# evaluates the next one into the back buffers of the bodies and belts while
+# the main thread shows the frame and waits for the next. NumPy releases the
+# GIL in its array loops, so on a multi-core machine the update overlaps
+# display.flip and the frame-rate limiter.
+class StateUpdater:
+    def __init__(self, layers):
+        self.layers = layers
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None  # (frame, future) being computed in the background
+
+    def compute(self, frame):
+        for layer in self.layers:
+            layer.compute(frame)
+
+    def prepare(self, frame):
+        self.pending = (frame, self.executor.submit(self.compute, frame))
+
+    # Bring a frame within tolerance of the requested one to the front and
+    # return it. The prepared frame is used if it is close enough, otherwise
+    # (after seeking or a slow frame, say) the requested frame is computed on
+    # the spot.
+    def acquire(self, frame, tolerance):
+        prepared = None
+        if self.pending:
+            prepared, future = self.pending
+            self.pending = None
+            future.result()
+        if prepared is None or abs(prepared - frame) > tolerance:
+            self.compute(frame)
+            prepared = frame
+        for layer in self.layers:
+            layer.swap()
+        return prepared
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+state_updater = StateUpdater([bodies, asteroid_belt_data, kuiper_objects_data])
+PREPARED_FRAME_TOLERANCE = 0.1  # Steps a prepared frame may be off by when shown
+
+
+PROFILE_HISTORY = 240  # Frames shown in the profiler overlay
+PROFILE_GRAPH_MS = 40  # Frame time at the top of the overlay graph
+PROFILE_GRAPH_HEIGHT = 160
+PROFILE_LEGEND_REFRESH = 30  # Frames between updates of the overlay's numbers
+PROFILE_TRACE_EVENTS = 500_000  # Newest stage timings kept for trace export
+PROFILE_TRACE_FILE = "solar_system_trace.json"  # Shift+P default without --trace
+PROFILE_BACKGROUND = (20, 20, 20)
+PROFILE_COLORS = [
+    (230, 25, 75),
+    (60, 180, 75),
+    (255, 225, 25),
+    (67, 99, 216),
+    (245, 130, 49),
+    (145, 30, 180),
+    (66, 212, 244),
+    (240, 50, 230),
+    (191, 239, 69),
+    (250, 190, 212),
+    (70, 153, 144),
+    (220, 190, 255),
+]
+
+
+# Wall-clock timing of the main loop's stages. Every frame's stage times feed
+# a rolling stacked graph, shown with P, and a bounded log of trace events
+# that Shift+P or --trace writes out for chrome://tracing or Perfetto.
+class FrameProfiler:
+    def __init__(self):
+        self.stages = []  # Stage names, in order of first use
+        self.history = np.zeros((PROFILE_HISTORY, 0))  # Milliseconds per stage
+        self.frames = 0
+        self.frame_start = time.perf_counter_ns()
+        self.frame_times = {}  # Stage -> nanoseconds in the current frame
+        self.nested = []  # Time in nested stages, for each open stage
+        # Ring buffer of trace events, as columns of (name id, start, length)
+        self.event_ids = {}  # Event name -> id
+        self.event_name = np.zeros(PROFILE_TRACE_EVENTS, dtype=np.int32)
+        self.event_start = np.zeros(PROFILE_TRACE_EVENTS, dtype=np.int64)
+        self.event_length = np.zeros(PROFILE_TRACE_EVENTS, dtype=np.int64)
+        self.event_count = 0  # Events recorded, including overwritten ones
+        self.origin = self.frame_start
+        self.visible = False
+        self.legend = None
+
+    # Time a stage. Stages can nest; the graph counts only the time spent in
+    # a stage itself, while the trace keeps whole durations and shows nesting.
+    @contextmanager
+    def stage(self, name):
+        self.nested.append(0)
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            length = time.perf_counter_ns() - start
+            own_time = length - self.nested.pop()
+            if self.nested:
+                self.nested[-1] += length
+            self.frame_times[name] = self.frame_times.get(name, 0) + own_time
+            self.record(name, start, length)
+
+    def record(self, name, start, length):
+        slot = self.event_count % PROFILE_TRACE_EVENTS
+        self.event_name[slot] = self.event_ids.setdefault(name, len(self.event_ids))
+        self.event_start[slot] = start
+        self.event_length[slot] = length
+        self.event_count += 1
+
+    def end_frame(self):
+        now = time.perf_counter_ns()
+        self.record("frame", self.frame_start, now - self.frame_start)
+        self.frame_start = now
+        for name in self.frame_times:
+            if name not in self.stages:
+                self.stages.append(name)
+                self.history = np.pad(self.history, ((0, 0), (0, 1)))
+        row = self.history[self.frames % PROFILE_HISTORY]
+        row[:] = 0
+        for name, length in self.frame_times.items():
+            row[self.stages.index(name)] = length / 1e6
+        self.frame_times.clear()
+        self.frames += 1
+
+    # Rows of history, oldest first
+    def recent(self):
+        count = min(self.frames, PROFILE_HISTORY)
+        return np.roll(self.history, -self.frames, axis=0)[-count:]
+
+    def render_legend(self):
+        recent = self.recent()
+        font = get_font(TEXT_SIZE)
+        columns = [(name, recent[:, i]) for i, name in enumerate(self.stages)]
+        columns.append((None, recent.sum(axis=1)))
+        lines = [
+            (name, f"{name or 'total'}  {ms.mean():.2f} ms  max {ms.max():.2f}")
+            for name, ms in columns
+        ]
+        line_height = font.get_linesize()
+        legend = pygame.Surface((PROFILE_HISTORY * 2, len(lines) * line_height))
+        legend.fill(PROFILE_BACKGROUND)
+        for i, (name, text) in enumerate(lines):
+            color = (
+                PROFILE_COLORS[self.stages.index(name) % len(PROFILE_COLORS)]
+                if name
+                else (255, 255, 255)
+            )
+            legend.blit(font.render(text, True, color), (0, i * line_height))
+        return legend
+
+    # Stacked per-stage frame times, newest frame on the right
+    def draw(self, screen):
+        recent = self.recent()
+        scale = PROFILE_GRAPH_HEIGHT / PROFILE_GRAPH_MS
+        tops = np.cumsum(recent, axis=1) * scale  # Top of each stage's bar
+        heights = np.arange(PROFILE_GRAPH_HEIGHT) + 0.5
+        # Index of the stage covering each pixel; past the last stage is empty
+        stage = (tops[:, :, None] <= heights).sum(axis=1)
+        palette = np.array(
+            [PROFILE_COLORS[i % len(PROFILE_COLORS)] for i in range(len(self.stages))]
+            + [PROFILE_BACKGROUND],
+            dtype=np.uint8,
+        )
+        pixels = np.full((PROFILE_HISTORY, PROFILE_GRAPH_HEIGHT, 3), PROFILE_BACKGROUND)
+        pixels[PROFILE_HISTORY - len(recent) :] = palette[stage][:, ::-1]
+        graph = pygame.transform.scale(
+            pygame.surfarray.make_surface(pixels),
+            (PROFILE_HISTORY * 2, PROFILE_GRAPH_HEIGHT),
+        )
+        if self.legend is None or self.frames % PROFILE_LEGEND_REFRESH == 0:
+            self.legend = self.render_legend()
+        return [
+            screen.blit(graph, (10, 10)),
+            screen.blit(self.legend, (10, 10 + PROFILE_GRAPH_HEIGHT)),
+        ]
+
+    def export_trace(self, path):
+        names = list(self.event_ids)
+        count = min(self.event_count, PROFILE_TRACE_EVENTS)
+        slots = (self.event_count - count + np.arange(count)) % PROFILE_TRACE_EVENTS
+        events = [
+            {
+                "name": name,
+                "ph": "X",  # Complete event, with a duration
+                "ts": (start - self.origin) / 1000,  # Microseconds
+                "dur": length / 1000,
+                "pid": 0,
+                "tid": 0,
+            }
+            for name, start, length in zip(
+                [names[i] for i in self.event_name[slots].tolist()],
+                self.event_start[slots].tolist(),
+                self.event_length[slots].tolist(),
+            )
+        ]
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+
+
+profiler = FrameProfiler()
+
+
+IDLE_WAIT_MS = 250  # Longest a paused, unchanged scene sleeps between checks
+
+
+# Sends finished frames to the display. A new scene is flipped whole; while it
+# stands still, only the overlays drawn over it change. The clean scene is
+# copied aside before the first overlay covers it, so overlays are erased by
+# copying back what was under them, and only the rectangles they touched are
+# updated on the display.
+class FramePresenter:
+    def __init__(self):
+        self.clean = pygame.Surface((WIDTH, HEIGHT)).convert()
+        self.clean_saved = False
+        self.overlays = []  # Screen areas covered by overlays
+        self.dirty = []  # Screen areas changed since the last present
+        self.full = True  # The whole screen changed
+
+    def new_scene(self):
+        self.clean_saved = False
+        self.overlays = []
+        self.full = True
+
+    def erase_overlays(self, screen):
+        for rect in self.overlays:
+            screen.blit(self.clean, rect, rect)
+        self.dirty += self.overlays
+        self.overlays = []
+
+    # Call draw(screen), which returns the rectangles it drew over
+    def draw_overlay(self, screen, draw):
+        if not self.clean_saved:
+            self.clean.blit(screen, (0, 0))
+            self.clean_saved = True
+        rects = draw(screen)
+        self.overlays += rects
+        self.dirty += rects
+
+    # Returns whether anything was sent to the display
+    def present(self):
+        changed = self.full or bool(self.dirty)
+        if self.full:
+            pygame.display.flip()
+        elif self.dirty:
+            pygame.display.update(self.dirty)
+        self.full = False
+        self.dirty = []
+        return changed
+
+
+presenter = FramePresenter()
+
+
+SNAPSHOT_FILE = "solar_system.snap"  # Saved to by S without --snapshot
+SNAPSHOT_BELTS = {"asteroids": asteroid_belt_data, "kuiper": kuiper_objects_data}
+
+
+# Save the orbits of every body and belt object, the trails, the clock and
+# the camera, so the session can be resumed with --snapshot
+def save_snapshot(path):
+    state = {
+        "bodies": bodies.names,
+        "palette": bodies.palette,
+        "catalog": args.catalog and os.path.abspath(args.catalog),
+        "sim_frame": sim_frame,
+        "time_scale": time_scale,
+        "trail_frame": trail_frame,
+        "trail_head": planet_trails.head,
+        "trail_count": planet_trails.count,
+        "zoom": zoom,
+        "pan_offset": [pan_offset_x, pan_offset_y],
+        "paused": paused,
+        "show_clock": show_clock,
+    }
+    arrays = {
+        f"bodies.{column}": getattr(bodies, column) for column in BodyTable.COLUMNS
+    }
+    for name, belt in SNAPSHOT_BELTS.items():
+        for array in Belt.ORBIT_ARRAYS:
+            arrays[f"{name}.{array}"] = getattr(belt, array)
+    arrays["trails"] = planet_trails.world
+    write_snapshot(path, state, arrays)
+
+
+# Restore a snapshot over the scene built at startup. Its arrays stay memory
+# mapped, so even very large belts are back without being read in.
+def restore_snapshot(snapshot):
+    global sim_frame, render_frame, time_scale, trail_frame, zoom
+    global pan_offset_x, pan_offset_y, paused, show_clock
+    state = snapshot.state
+    if state["bodies"] != bodies.names:
+        raise ValueError(f"{snapshot.path} was saved with different bodies")
+    bodies.restore(
+        {column: snapshot[f"bodies.{column}"] for column in BodyTable.COLUMNS},
+        state["palette"],
+    )
+    for name, belt in SNAPSHOT_BELTS.items():
+        for array in Belt.ORBIT_ARRAYS:
+            setattr(belt, array, snapshot[f"{name}.{array}"])
+        belt.allocate()
+    if trails_outdated():
+        allocate_trails()
+    if snapshot["trails"].shape == planet_trails.world.shape:
+        planet_trails.world = snapshot["trails"]
+        planet_trails.head = state["trail_head"]
+        planet_trails.count = state["trail_count"]
+        planet_trails.view = None
+        trail_frame = state["trail_frame"]
+    else:  # Saved with another trail length
+        fill_trails(state["sim_frame"])
+        trail_frame = state["sim_frame"]
+    sim_frame = render_frame = state["sim_frame"]
+    time_scale = state["time_scale"]
+    zoom = state["zoom"]
+    pan_offset_x, pan_offset_y = state["pan_offset"]
+    paused = state["paused"]
+    show_clock = state["show_clock"]
+    tint_layers.invalidate()
+
+
+if snapshot:
+    restore_snapshot(snapshot)
+if args.start_frame is None:
+    args.start_frame = sim_frame
+
+
+EXPORT_CHUNK_FRAMES = 8  # Consecutive frames rendered by one export task
+# BT.601 studio-swing RGB to YCbCr, for Y4M output
+YCBCR_MATRIX = np.array(
+    [
+        [65.481, 128.553, 24.966],
+        [-37.797, -74.203, 112.0],
+        [112.0, -93.786, -18.214],
+    ],
+    dtype=np.float32,
+) / np.float32(255)
+YCBCR_OFFSET = np.array([16, 128, 128], dtype=np.float32)
+
+
+# Render exported frames first to last into the screen surface and return
+# each as planar 4:4:4 YCbCr bytes for Y4M, or write it as a PNG. Every frame
+# is a pure function of its simulation frame, so any process can render any
+# range of them.
+def export_frames(first, last):
+    global render_frame
+    encoded = []
+    for index in range(first, last):
+        render_frame = args.start_frame + index * args.frame_step
+        for layer in state_updater.layers:
+            layer.compute(render_frame)
+            layer.swap()
+        # The trails grow from where the scene's began, a point a frame, as
+        # they do when playing on from it; before that they are whole, as
+        # after a seek
+        since = render_frame - export_trail_start
+        count = min(trail_length, int(since)) if since >= 0 else trail_length
+        fill_trails(render_frame, count)
+        planet_trails.project(*world_view())
+        draw_scene()
+        if args.export.endswith(".y4m") or args.export == "-":
+            rgb = pygame.surfarray.pixels3d(screen).astype(np.float32)
+            # surfarray is indexed (x, y); Y4M planes are stored row by row
+            planes = np.tensordot(YCBCR_MATRIX, rgb, axes=(1, 2))
+            planes += YCBCR_OFFSET[:, None, None]
+            encoded.append(planes.transpose(0, 2, 1).round().astype(np.uint8).tobytes())
+        else:
+            pygame.image.save(screen, os.path.join(args.export, f"{index:06d}.png"))
+    return encoded
+
+
+def export_chunk(first):
+    return export_frames(first, min(first + EXPORT_CHUNK_FRAMES, args.frames))
+
+
+# Workers started by spawning build the scene afresh, with other random moons
+# and belts unless seeded, so every worker loads the exporting scene from a
+# snapshot before rendering
+def start_export_worker(snapshot_path):
+    global export_trail_start
+    restore_snapshot(open_snapshot(snapshot_path))
+    export_trail_start = trail_frame - planet_trails.count
+
+
+# Render args.frames frames headlessly, sharing chunks of consecutive frames
+# among worker processes. Y4M frames are written in order as the chunks
+# complete.
+def export_video():
+    y4m = args.export.endswith(".y4m") or args.export == "-"
+    if y4m:
+        if args.export == "-":
+            output = sys.stdout.buffer
+        else:
+            output = open(args.export, "wb")
+        output.write(
+            f"YUV4MPEG2 W{WIDTH} H{HEIGHT} F{args.video_fps}:1 Ip A1:1 C444\n".encode()
+        )
+    else:
+        os.makedirs(args.export, exist_ok=True)
+    chunks = range(0, args.frames, EXPORT_CHUNK_FRAMES)
+    snapshot_file, snapshot_path = tempfile.mkstemp(suffix=".snap")
+    os.close(snapshot_file)
+    try:
+        save_snapshot(snapshot_path)
+        with multiprocessing.Pool(
+            max(1, args.workers), start_export_worker, (snapshot_path,)
+        ) as pool:
+            for i, frames in enumerate(pool.imap(export_chunk, chunks)):
+                for frame in frames:
+                    output.write(b"FRAME\n")
+                    output.write(frame)
+                done = min((i + 1) * EXPORT_CHUNK_FRAMES, args.frames)
+                print(f"Exported {done}/{args.frames} frames", file=sys.stderr)
+            # Let the workers exit on their own, as SDL catches the SIGTERM
+            # that leaving the block would send them
+            pool.close()
+            pool.join()
+    finally:
+        os.remove(snapshot_path)
+    if y4m and output is not sys.stdout.buffer:
+        output.close()
+
+
+# Spawned export workers import this script under another name; they only
+# build the scene, and render the frames they are handed
+export_worker = __name__ != "__main__"
+if args.export and not export_worker:
+    export_video()
+
+shown_hover = None  # What the info box on the screen belongs to, and where
 # Main loop
-running = True
+running = not args.export  # Exporting skips the interactive loop
+clock.tick()
+elapsed = 0.0
+next_frame = None  # Frame to prepare in the background, if time is moving
 while running:
     # Event handling
     for event in pygame.event.get():
@@ -480,143 +2300,124 @@ while running:
             if event.button == 1:  # Left mouse button
                 panning = True
                 pan_start_x, pan_start_y = event.pos
+            elif event.button == 3:  # Right mouse button scrubs through time
+                scrubbing = True
         elif event.type == pygame.MOUSEBUTTONUP:
             if event.button == 1:  # Left mouse button
                 panning = False
+            elif event.button == 3:
+                scrubbing = False
         elif event.type == pygame.MOUSEMOTION:
+            if scrubbing:
+                seek(event.rel[0] * SCRUB_FRAMES_PER_PIXEL)
             if panning:
                 mouse_x, mouse_y = event.pos
                 pan_offset_x += mouse_x - pan_start_x
                 pan_offset_y += mouse_y - pan_start_y
                 pan_start_x, pan_start_y = mouse_x, mouse_y
+                tint_layers.pan_moved(*world_view()[1:])
+                redraw = True
         elif event.type == pygame.MOUSEWHEEL:
             if event.y == 1:  # Scroll up
                 zoom *= 1.1
             elif event.y == -1:  # Scroll down
                 zoom /= 1.1
+            tint_layers.invalidate()
+            redraw = True
         elif event.type == pygame.KEYDOWN:
             if event.key == pygame.K_SPACE:
                 paused = not paused  # Toggle the pause state
-
-    if not paused and not info_box_visible:
-        # Clear the screen
-        screen.fill(DARK_GREY)
-        # Draw the asteroid belt
-        draw_asteroid_belt(
-            screen,
-            pan_offset_x,
-            pan_offset_y,
-            zoom,
-            INNER_BELT_RADIUS,
-            OUTER_BELT_RADIUS,
-        )
-
-        # Draw the Kuiper Belt tint
-        draw_kuiper_belt(screen, pan_offset_x, pan_offset_y, zoom)
-
-        draw_termination_shock(screen, pan_offset_x, pan_offset_y, zoom)
-
-        for asteroid in asteroid_belt_data:
-            asteroid["angle"] += asteroid["orbital_speed"]
-
-        # Update and draw each planet and their trails
-        for name, planet_data in solar_system_data.items():
-            parent_name = planet_data.get("parent")
-            if parent_name:
-                parent_planet = solar_system_data[parent_name]
-                planet_data["angle"] += planet_data["orbital_speed"]
-                orbit_x = parent_planet["distance"] * math.cos(
-                    parent_planet["angle"]
-                ) + planet_data["distance"] * math.cos(planet_data["angle"])
-                orbit_y = parent_planet["distance"] * math.sin(
-                    parent_planet["angle"]
-                ) + planet_data["distance"] * math.sin(planet_data["angle"])
-                x = orbit_x * zoom + pan_offset_x
-                y = orbit_y * zoom + pan_offset_y
-                px, py = int(x), int(y)
-                pygame.draw.circle(
+            elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                frames = SEEK_FRAMES * (10 if event.mod & pygame.KMOD_SHIFT else 1)
+                seek(frames if event.key == pygame.K_RIGHT else -frames)
+            elif event.key == pygame.K_UP:  # Fast-forward twice as fast
+                time_scale *= 2
+            elif event.key == pygame.K_DOWN:
+                time_scale /= 2
+            elif event.key == pygame.K_r:  # Play backwards
+                time_scale = -time_scale
+            elif event.key == pygame.K_HOME:  # Back to the start at normal speed
+                time_scale = 1.0
+                seek(-sim_frame)
+            elif event.key == pygame.K_t:
+                show_clock = not show_clock
+            elif event.key == pygame.K_s:
+                save_snapshot(args.snapshot or SNAPSHOT_FILE)
+            elif event.key == pygame.K_p:
+                if event.mod & pygame.KMOD_SHIFT:
+                    profiler.export_trace(args.trace or PROFILE_TRACE_FILE)
+                else:
+                    profiler.visible = not profiler.visible
+                    redraw = True
+
+    if not paused:
+        # Take the simulation steps that fit in the real time elapsed
+        step_accumulator += elapsed * SIMULATION_RATE
+        steps = int(step_accumulator)
+        step_accumulator -= steps
+        sim_frame += steps * time_scale
+        redraw = True
+
+    if redraw:
+        redraw = False
+        with profiler.stage("update"):
+            # Interpolate between the last step and the next one. A prepared
+            # frame that predicted this closely enough is shown as it is. A
+            # still scene, redrawn after a pan or zoom, keeps exactly its
+            # frame and has no next frame to predict.
+            target_frame = sim_frame + step_accumulator * time_scale
+            moving = not paused and target_frame != render_frame
+            tolerance = PREPARED_FRAME_TOLERANCE * abs(time_scale) if moving else 0
+            render_frame = state_updater.acquire(target_frame, tolerance)
+            if moving:
+                next_frame = target_frame + elapsed * SIMULATION_RATE * time_scale
+
+        with profiler.stage("trails"):
+            update_trails()
+        draw_scene()
+        presenter.new_scene()
+
+    # Always check for hover to display info boxes. Overlays are redrawn only
+    # on a new scene or when they change, so a still scene costs next to nothing.
+    with profiler.stage("hover"):
+        mouse_x, mouse_y = pygame.mouse.get_pos()
+        picked = hover_index.pick(mouse_x, mouse_y)
+        hover = picked and (picked[0], picked[1], mouse_x, mouse_y)
+        if presenter.full or hover != shown_hover or profiler.visible:
+            presenter.erase_overlays(screen)
+            if picked:
+                kind, index, position = picked
+                presenter.draw_overlay(
                     screen,
-                    planet_data["color"],
-                    (px, py),
-                    int(planet_data["radius"] * zoom),
+                    lambda surface: draw_info_box(
+                        surface, hover_text(kind, index), position, (mouse_x, mouse_y)
+                    ),
                 )
-            else:
-                planet_data["angle"] += planet_data["orbital_speed"]
-                draw_planet(planet_data, planet_trails[name])
-
-        # Draw rings for Saturn and Uranus with adjusted zoom
-        saturn_data = solar_system_data["Saturn"]
-        uranus_data = solar_system_data["Uranus"]
-        neptune_data = solar_system_data["Neptune"]
-        draw_rings(saturn_data, 1, saturn_data["radius"] + 6, saturn_data["radius"] + 9)
-        draw_rings(uranus_data, 1, uranus_data["radius"] + 5, uranus_data["radius"] + 7)
-        draw_rings(
-            neptune_data, 1, neptune_data["radius"] + 4, neptune_data["radius"] + 5
-        )
+            shown_hover = hover
 
-    # Always check for hover to display info boxes
-    mouse_x, mouse_y = pygame.mouse.get_pos()
-    hovered = False
-    for name, planet_data in solar_system_data.items():
-        if (
-            "distance" in planet_data
-            and not "parent" in planet_data
-            or "radius" in dwarf_planet_data
-        ):  # Only consider actual planets that have 'distance' defined
-            if "parent" not in planet_data:  # Check for planets and dwarf planets
-                # Calculate positional data depending on the type of object
-                if (
-                    "semi_major_axis" in planet_data
-                    and "semi_minor_axis" in planet_data
-                ):
-                    # Dwarf planet with elliptical orbit
-                    planet_screen_x = (
-                        pan_offset_x
-                        + planet_data["semi_major_axis"]
-                        * math.cos(planet_data["angle"])
-                        * zoom
-                    )
-                    planet_screen_y = (
-                        pan_offset_y
-                        + planet_data["semi_minor_axis"]
-                        * math.sin(planet_data["angle"])
-                        * zoom
-                    )
-                else:
-                    # Regular planet with circular orbit
-                    planet_screen_x = (
-                        pan_offset_x
-                        + planet_data["distance"]
-                        * math.cos(planet_data["angle"])
-                        * zoom
-                    )
-                    planet_screen_y = (
-                        pan_offset_y
-                        + planet_data["distance"]
-                        * math.sin(planet_data["angle"])
-                        * zoom
-                    )
-                if (
-                    math.hypot(planet_screen_x - mouse_x, planet_screen_y - mouse_y)
-                    <= planet_data["radius"] * zoom
-                ):
-                    hovered = True
-                    if not info_box_visible:
-                        info_text = planet_info.get(name, "Information not available")
-                        draw_info_box(
-                            screen,
-                            info_text,
-                            (planet_screen_x, planet_screen_y),
-                            (mouse_x, mouse_y),
-                        )
-                        info_box_visible = True
-                    break
-
-    if not hovered and info_box_visible:
-        info_box_visible = False  # Reset the flag when not hovering
+    if profiler.visible:
+        presenter.draw_overlay(screen, profiler.draw)
 
-    # Refresh the screen
-    pygame.display.flip()
-    clock.tick(1000)
+    # Start on the next frame, assuming it comes as long after this one as
+    # this one came after the last
+    if next_frame is not None:
+        state_updater.prepare(next_frame)
+        next_frame = None
 
-pygame.quit()
+    # Refresh the screen
+    with profiler.stage("flip"):
+        presented = presenter.present()
+    profiler.end_frame()
+    if paused and not presented:
+        # Nothing will change until something happens; sleep until it does
+        event = pygame.event.wait(IDLE_WAIT_MS)
+        if event.type != pygame.NOEVENT:
+            pygame.event.post(event)
+        clock.tick()  # The sleep is not time the simulation should catch up on
+    elapsed = clock.tick(args.fps) / 1000  # Seconds since the last frame
+
+if not export_worker:
+    if args.trace:
+        profiler.export_trace(args.trace)
+    state_updater.shutdown()
+    pygame.quit()
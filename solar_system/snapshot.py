@@ -0,0 +1,106 @@
+import json
+import os
+import numpy as np
+
+# Snapshot files saving the state of a main.py session.
+#
+# A snapshot is a 64 byte header, a JSON document with the scalar state and a
+# table of the arrays, then the arrays themselves as raw little-endian data,
+# each aligned to ARRAY_ALIGNMENT bytes. Arrays are opened with numpy.memmap
+# in copy-on-write mode: nothing is read until it is used, and changes made
+# by the running scene never reach the file.
+SNAPSHOT_MAGIC = b"SSSNAP"
+SNAPSHOT_VERSION = 1
+ARRAY_ALIGNMENT = 64
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("array_count", "<u4"),
+        ("metadata_size", "<u8"),
+        ("reserved", "V40"),
+    ]
+)
+
+
+def align(offset):
+    return -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+
+
+class Snapshot:
+    def __init__(self, path):
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if len(header) != 1 or header["magic"][0] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a solar system snapshot")
+        header = header[0]
+        if header["version"] != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"{path} has snapshot version {header['version']}, "
+                f"expected {SNAPSHOT_VERSION}"
+            )
+        with open(path, "rb") as snapshot_file:
+            snapshot_file.seek(HEADER_DTYPE.itemsize)
+            metadata = json.loads(snapshot_file.read(int(header["metadata_size"])))
+        if len(metadata["arrays"]) != header["array_count"]:
+            raise ValueError(f"{path} has a damaged array table")
+        self.path = path
+        self.state = metadata["state"]
+        data_start = align(HEADER_DTYPE.itemsize + int(header["metadata_size"]))
+        self.arrays = {}
+        for entry in metadata["arrays"]:
+            dtype = np.dtype(entry["dtype"])
+            shape = tuple(entry["shape"])
+            if 0 in shape:
+                self.arrays[entry["name"]] = np.zeros(shape, dtype=dtype)
+            else:
+                self.arrays[entry["name"]] = np.memmap(
+                    path,
+                    dtype=dtype,
+                    mode="c",
+                    offset=data_start + entry["offset"],
+                    shape=shape,
+                )
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+
+def open_snapshot(path):
+    return Snapshot(path)
+
+
+# Write the JSON-serializable state and the named arrays to a snapshot file.
+# The file is replaced whole, so a snapshot still mapped by the scene that is
+# saving over it keeps its old contents.
+def write_snapshot(path, state, arrays):
+    table = []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        table.append(
+            {
+                "name": name,
+                "dtype": array.dtype.newbyteorder("<").str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+        )
+        offset = align(offset + array.nbytes)
+    metadata = json.dumps({"state": state, "arrays": table}).encode()
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = SNAPSHOT_MAGIC
+    header["version"] = SNAPSHOT_VERSION
+    header["array_count"] = len(table)
+    header["metadata_size"] = len(metadata)
+    data_start = align(HEADER_DTYPE.itemsize + len(metadata))
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as snapshot_file:
+        header.tofile(snapshot_file)
+        snapshot_file.write(metadata)
+        for entry, array in zip(table, arrays.values()):
+            snapshot_file.seek(data_start + entry["offset"])
+            np.ascontiguousarray(array, dtype=entry["dtype"]).tofile(snapshot_file)
+        # Pad the file to its full length, in case the last array is empty
+        snapshot_file.truncate(data_start + offset)
+    os.replace(temporary_path, path)
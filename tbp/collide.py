@@ -1,6 +1,57 @@
+import argparse
 import pygame
 import numpy as np
 from pygame.locals import QUIT
+from gravity import BARNES_HUT_THETA, barnes_hut_acceleration, pairwise_acceleration
+from integrators import INTEGRATOR_NAMES, RK45_TOLERANCE, make_integrator
+from collisions import touching_pairs
+
+parser = argparse.ArgumentParser(description="Three-Body Problem")
+parser.add_argument(
+    "--bodies",
+    type=int,
+    default=2,
+    help="number of bodies; those past the first two start like star 1, "
+    "scattered over the window (default: %(default)s)",
+)
+parser.add_argument("--seed", type=int, help="seed for the scattered bodies")
+parser.add_argument(
+    "--gravity",
+    choices=["direct", "barnes-hut"],
+    default="direct",
+    help="sum every pair, or approximate distant bodies with a quadtree; "
+    "worth it from a few thousand bodies (default: %(default)s)",
+)
+parser.add_argument(
+    "--theta",
+    type=float,
+    default=BARNES_HUT_THETA,
+    help="Barnes-Hut opening angle; larger is faster and less accurate "
+    "(default: %(default)s)",
+)
+parser.add_argument(
+    "--integrator",
+    choices=INTEGRATOR_NAMES,
+    default="euler",
+    help="time integrator; leapfrog and yoshida4 keep orbits with far longer "
+    "steps, and block gives each body its own (default: %(default)s)",
+)
+parser.add_argument(
+    "--dt", type=float, help="simulated time per frame (default: the scene's own)"
+)
+parser.add_argument(
+    "--substeps",
+    type=int,
+    default=1,
+    help="integrator steps per frame (default: %(default)s)",
+)
+parser.add_argument(
+    "--tolerance",
+    type=float,
+    default=RK45_TOLERANCE,
+    help="rk45 position error allowed per step, in pixels (default: %(default)s)",
+)
+args = parser.parse_args()
 
 # Initialize Pygame
 pygame.init()
@@ -105,8 +156,11 @@ note_cooldown = 200  # Cooldown between notes in milliseconds
 
 # Constants
 G = 5e-12  # Gravitational constant in our simulation
-dt = 0.0000000005  # sTime step for the integrator
+dt = args.dt or 0.0000000005  # Simulated time per frame
+FORCE_EXPONENT = 1.31  # Pull falls off as distance ** (1 - FORCE_EXPONENT)
+SOFTENING = 1.0  # Pixels added to distances in quadrature, keeping them finite
 MASS_SCALE = 300000000000000000000000000  # Scale factor for drawing the stars
+COINCIDENT_AXIS = (1.0, 0.0)  # Direction that parts bodies on the same spot
 
 # Initial conditions
 masses = np.array([1.98e30, 6e24])  # Mass of the stars in tons
@@ -121,86 +175,117 @@ velocities[0, 1] = 0  # Star 0 velocity in y-direction
 velocities[1, 1] = 2e10  # Star 1 velocity in y-direction
 velocities[0, 0] = 0  # Star 0 velocity in x-direction
 velocities[1, 0] = 2e8  # Star 1 velocity in x-direction
-trail_points = [[] for _ in positions]  # List to store the trail points for each circle
 
+# Bodies past the first two copy star 1's mass and velocity at random places
+extra_bodies = max(0, args.bodies - len(masses))
+rng = np.random.default_rng(args.seed)
+masses = np.concatenate((masses, np.full(extra_bodies, masses[1])))
+positions = np.concatenate(
+    (positions, rng.uniform((0, 0), (WIDTH, HEIGHT), (extra_bodies, 2)))
+)
+velocities = np.concatenate((velocities, np.tile(velocities[1], (extra_bodies, 1))))
+
+# List to store the trail points for each circle; only the colored stars
+# leave trails
+trail_points = [[] for _ in positions[: len(colors)]]
+
+# Radii of the bodies, kept until their masses change
+radius_masses = None
+radii = None
+
+
+def body_radii(masses):
+    global radius_masses, radii
+    if radius_masses is None or not np.array_equal(radius_masses, masses):
+        radius_masses = masses.copy()
+        radii = np.sqrt(masses / MASS_SCALE)
+    return radii
+
+
+# Collide every pair of touching bodies at once. Pairs are found by a sweep
+# along x, so bodies far apart are never compared; a body touching several
+# others gets the sum of its shares of the responses.
 def check_collision_and_update_masses(masses, positions, velocities, current_note, last_note_time):
-    num_bodies = len(masses)
-    for i in range(num_bodies):
-        for j in range(i+1, num_bodies):  # Only check each pair once
-            distance = np.linalg.norm(positions[i] - positions[j])
-            radius_i = np.sqrt(masses[i] / MASS_SCALE)
-            radius_j = np.sqrt(masses[j] / MASS_SCALE)
-            # Determine if there's a collision
-            if distance < (radius_i + radius_j):
-                # Calculate elastic collision response
-
-                # Move to the next note, wrapping around if at the end of the list
-                available_channel = next(
-                    (channel for channel in channels if not channel.get_busy()), None
-                )
-                if available_channel is not None:
-                    available_channel.play(notes[current_note])
-                current_note = (current_note + 1) % len(notes)
-
-                mass_sum = masses[i] + masses[j]
-                v1 = velocities[i] - 2 * masses[j] / mass_sum * (np.dot(velocities[i] - velocities[j], positions[i] - positions[j]) /
-                                                                  np.linalg.norm(positions[i] - positions[j])**2) * (positions[i] - positions[j])
-                v2 = velocities[j] - 2 * masses[i] / mass_sum * (np.dot(velocities[j] - velocities[i], positions[j] - positions[i]) /
-                                                                  np.linalg.norm(positions[j] - positions[i])**2) * (positions[j] - positions[i])
-                velocities[i] = v1
-                velocities[j] = v2
-
-                # # Apply growth to the masses
-                # masses[i] *= 1.1
-                # masses[j] *= 1.1
-
-                # Repulsion step to prevent sticking
-                overlap = (radius_i + radius_j) - distance
-                direction = (positions[j] - positions[i]) / distance
-                repulsion_force = direction * overlap * 0.5
-                positions[i] -= repulsion_force
-                positions[j] += repulsion_force
-
-                # Play a sound if the cooldown has passed
-                current_time = pygame.time.get_ticks()
-                if current_time - last_note_time >= note_cooldown:
-                    available_channel = next(
-                        (channel for channel in channels if not channel.get_busy()), None
-                    )
-                    if available_channel:
-                        available_channel.play(notes[current_note])
-                    last_note_time = current_time
-                    current_note = (current_note + 1) % len(notes)
+    body_radius = body_radii(masses)
+    i, j, distance = touching_pairs(positions, body_radius)
+
+    # Unit vectors along the line between the centers. Bodies sitting on the
+    # same spot, as when the walls pin several to a corner, have no such line
+    # and are parted along x instead
+    offset = positions[i] - positions[j]
+    apart = distance > 0
+    normal = np.empty_like(offset)
+    normal[:] = COINCIDENT_AXIS
+    normal[apart] = offset[apart] / distance[apart, None]
+
+    # Calculate elastic collision response, exchanging momentum along the
+    # line between the centers. A body in several contacts would take a full
+    # exchange from each of them, which runs away in a crowded pile, so every
+    # pair gives the share its busier body can take
+    closing = np.einsum("ij,ij->i", velocities[i] - velocities[j], normal)
+    contacts = np.bincount(i, minlength=len(masses))
+    contacts += np.bincount(j, minlength=len(masses))
+    share = 1 / np.maximum(contacts[i], contacts[j])
+    impulse = (2 * share * closing / (masses[i] + masses[j]))[:, None] * normal
+    np.add.at(velocities, i, -masses[j][:, None] * impulse)
+    np.add.at(velocities, j, masses[i][:, None] * impulse)
+
+    # # Apply growth to the masses
+    # masses[i] *= 1.1
+    # masses[j] *= 1.1
+
+    # Repulsion step to prevent sticking
+    overlap = (body_radius[i] + body_radius[j]) - distance
+    repulsion_force = normal * (overlap * 0.5)[:, None]
+    np.add.at(positions, i, repulsion_force)
+    np.add.at(positions, j, -repulsion_force)
+
+    # Every collision moves to the next note, playing it on a free channel,
+    # and plays one more if the cooldown has passed
+    free_channels = [channel for channel in channels if not channel.get_busy()]
+    for _ in range(len(i)):
+        if free_channels:
+            free_channels.pop(0).play(notes[current_note])
+        current_note = (current_note + 1) % len(notes)
+
+        # Play a sound if the cooldown has passed
+        current_time = pygame.time.get_ticks()
+        if current_time - last_note_time >= note_cooldown:
+            if free_channels:
+                free_channels.pop(0).play(notes[current_note])
+            last_note_time = current_time
+            current_note = (current_note + 1) % len(notes)
 
     return velocities, current_note, last_note_time
 
 # Define the acceleration due to gravity
-def gravity_acceleration(masses, positions):
-    acc = np.zeros_like(positions)
-    num_bodies = len(masses)
-    for i in range(num_bodies):
-        for j in range(num_bodies):
-            if i != j:
-                r_vec = positions[j] - positions[i]
-                r_mag = np.linalg.norm(r_vec)
-                acc[i] += G * masses[j] * r_vec / r_mag**1.31
-    return acc
+def gravity_acceleration(masses, positions, targets=None):
+    if args.gravity == "barnes-hut":
+        return barnes_hut_acceleration(
+            masses, positions, G, FORCE_EXPONENT, SOFTENING, args.theta, targets
+        )
+    return pairwise_acceleration(
+        masses, positions, G, FORCE_EXPONENT, SOFTENING, targets=targets
+    )
+
+
+integrate = make_integrator(args.integrator, args.tolerance)
 
 
 # Define the update function
 def update_system(masses, positions, velocities, dt):
-    pos_new = positions + velocities * dt
-    acc = gravity_acceleration(masses, positions)
-    vel_new = velocities + acc * dt
-
-    # Check for boundary collision and bounce if necessary
-    for i, pos in enumerate(pos_new):
-        if pos[0] <= 0 or pos[0] >= WIDTH:  # Check x boundaries
-            vel_new[i, 0] = -vel_new[i, 0] + (0.8*vel_new[i, 0])  # Reverse x velocity
-            pos_new[i, 0] = max(0, min(pos[0], WIDTH))  # Keep inside window
-        if pos[1] <= 0 or pos[1] >= HEIGHT:  # Check y boundaries
-            vel_new[i, 1] = -vel_new[i, 1] + (0.8*vel_new[i, 1])  # Reverse y velocity
-            pos_new[i, 1] = max(0, min(pos[1], HEIGHT))  # Keep inside window
+    def accelerate(positions, targets=None):
+        return gravity_acceleration(masses, positions, targets)
+
+    pos_new, vel_new = positions, velocities
+    for _ in range(args.substeps):
+        pos_new, vel_new = integrate(pos_new, vel_new, dt / args.substeps, accelerate)
+
+    # Check for boundary collision and bounce if necessary, on all bodies at once
+    for axis, size in ((0, WIDTH), (1, HEIGHT)):
+        outside = (pos_new[:, axis] <= 0) | (pos_new[:, axis] >= size)
+        vel_new[outside, axis] *= -0.2  # Reverse the velocity, keeping a fifth
+        np.clip(pos_new[:, axis], 0, size, out=pos_new[:, axis])  # Keep inside window
 
     return pos_new, vel_new
 
@@ -225,22 +310,24 @@ while running:
         current_note = (current_note + 1) % len(notes)
 
     for i, (pos, mass) in enumerate(zip(positions, masses)):
+        color = colors[i % len(colors)]
         # Add position to trail points, ensuring it's a valid integer tuple
-        trail_points[i].append(tuple(pos.astype(int)))
+        if i < len(trail_points):
+            trail_points[i].append(tuple(pos.astype(int)))
 
         # Draw the trail if there are at least 2 points, using the star's color
-        if len(trail_points[i]) >= 2:
+        if i < len(trail_points) and len(trail_points[i]) >= 2:
             if len(trail_points[i]) > 200:  # Limit the number of trail points
                 trail_points[i].pop(0)
             # Use the color specific to this star for the trail
-            pygame.draw.lines(screen, colors[i], False, trail_points[i], 3)  # Draw the trail line
+            pygame.draw.lines(screen, color, False, trail_points[i], 3)  # Draw the trail line
 
         # Draw the circle with a black border and fill with the star's color
         pygame.draw.circle(
             screen, WHITE, pos.astype(int), int(np.sqrt(mass / MASS_SCALE) + 2)
         )
         pygame.draw.circle(
-            screen, colors[i], pos.astype(int), int(np.sqrt(mass / MASS_SCALE))
+            screen, color, pos.astype(int), int(np.sqrt(mass / MASS_SCALE))
         )
 
     pygame.display.flip()
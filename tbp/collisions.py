@@ -0,0 +1,30 @@
+import numpy as np
+from gravity import expand_ranges
+
+# Collision detection for the three-body scenes.
+#
+# Bodies are discs. The broad phase sweeps them along x: sorted by their left
+# edges, each body is paired with the later bodies whose left edges come
+# before its right edge. That is close to linear in the number of bodies
+# while few of them overlap along x. The narrow phase then measures the
+# distances of all candidate pairs at once.
+
+
+# Pairs of bodies whose extents along x overlap, as two index arrays
+def sweep_pairs(positions, radii):
+    left = positions[:, 0] - radii
+    order = np.argsort(left, kind="stable")
+    left = left[order]
+    right = positions[order, 0] + radii[order]
+    later = np.arange(1, len(order) + 1)  # Sorted index of each body's successor
+    counts = np.searchsorted(left, right, side="right") - later
+    return np.repeat(order, counts), order[expand_ranges(later, counts)]
+
+
+# Pairs of overlapping bodies, as index arrays of the first and second
+# bodies, with the distances between their centers
+def touching_pairs(positions, radii):
+    first, second = sweep_pairs(positions, radii)
+    distance = np.hypot(*(positions[first] - positions[second]).T)
+    touching = distance < radii[first] + radii[second]
+    return first[touching], second[touching], distance[touching]
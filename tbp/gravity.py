@@ -0,0 +1,410 @@
+import argparse
+import os
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# Gravity shared by the three-body scenes.
+#
+# The scenes use their own force laws: a body of mass m at displacement r_vec
+# pulls with acceleration g * m * r_vec / |r_vec|**exponent, so exponent 3 is
+# Newtonian gravity. Softening is added to every distance in quadrature,
+# which keeps close passes finite. Coincident bodies exert no force on each
+# other, with or without it.
+GRAVITY_BLOCK = 128  # Bodies per side of a block of pairs evaluated at once
+
+
+# Acceleration of every body from all the others. Pairs are evaluated in
+# square blocks over the upper triangle of the pair matrix, so memory use is
+# bounded by the block size. Each pair's weight g / r**exponent is computed
+# once and applied to both bodies, with opposite signs (Newton's third law).
+# Given targets, an index array, only those bodies' accelerations are summed
+# and returned.
+def pairwise_acceleration(
+    masses, positions, g, exponent, softening=0.0, block=GRAVITY_BLOCK, targets=None
+):
+    masses = np.asarray(masses, dtype=float)
+    positions = np.asarray(positions, dtype=float)
+    if targets is not None:
+        return targeted_acceleration(masses, positions, targets, g, exponent, softening)
+    count = len(masses)
+    acc = np.zeros_like(positions)
+    for start in range(0, count, block):
+        rows = slice(start, min(start + block, count))
+        for other in range(start, count, block):
+            columns = slice(other, min(other + block, count))
+            # Displacements from the row bodies to the column bodies
+            dx = positions[None, columns, 0] - positions[rows, None, 0]
+            dy = positions[None, columns, 1] - positions[rows, None, 1]
+            weight = dx * dx
+            weight += dy * dy
+            weight += softening * softening
+            if not softening:
+                weight += weight == 0  # Any distance will do, as dx and dy are 0
+            if other == start:
+                # The block holds both orders of each pair and every body
+                # paired with itself, which exerts no force
+                np.fill_diagonal(weight, np.inf)
+            # weight ** (-exponent / 2), as exp and log beat a float power
+            np.log(weight, out=weight)
+            weight *= -exponent / 2
+            np.exp(weight, out=weight)
+            weight *= g
+            dx *= weight
+            dy *= weight
+            acc[rows, 0] += dx @ masses[columns]
+            acc[rows, 1] += dy @ masses[columns]
+            if other != start:
+                acc[columns, 0] -= masses[rows] @ dx
+                acc[columns, 1] -= masses[rows] @ dy
+    return acc
+
+
+# Direct sums for the target bodies only, a row block of the pair matrix at
+# a time. Without the triangle's pairing each pair is weighed once per
+# target, which pays off while targets are a small share of the bodies.
+def targeted_acceleration(masses, positions, targets, g, exponent, softening):
+    acc = np.zeros((len(targets), 2))
+    block = max(1, (1 << 20) // len(masses))  # Rows of about a million pairs
+    for start in range(0, len(targets), block):
+        rows = targets[start : start + block]
+        dx = positions[None, :, 0] - positions[rows, None, 0]
+        dy = positions[None, :, 1] - positions[rows, None, 1]
+        weight = dx * dx
+        weight += dy * dy
+        weight += softening * softening
+        if not softening:
+            weight += weight == 0  # Any distance will do, as dx and dy are 0
+        weight[np.arange(len(rows)), rows] = np.inf
+        np.log(weight, out=weight)
+        weight *= -exponent / 2
+        np.exp(weight, out=weight)
+        weight *= g
+        acc[start : start + len(rows), 0] = (dx * weight) @ masses
+        acc[start : start + len(rows), 1] = (dy * weight) @ masses
+    return acc
+
+
+# Total potential energy of the force law, summed over all pairs directly.
+# For exponents other than 2 a pair at distance r holds
+# g * m1 * m2 * r**(2 - exponent) / (2 - exponent), zero at zero distance
+# when exponent < 2.
+def potential_energy(masses, positions, g, exponent, softening=0.0):
+    masses = np.asarray(masses, dtype=float)
+    positions = np.asarray(positions, dtype=float)
+    first, second = np.triu_indices(len(masses), 1)
+    distance2 = ((positions[first] - positions[second]) ** 2).sum(axis=1)
+    distance2 += softening * softening
+    if exponent == 2:
+        potential = np.log(distance2) / 2
+    else:
+        potential = distance2 ** (1 - exponent / 2) / (2 - exponent)
+    return g * masses[first] @ (masses[second] * potential)
+
+
+BARNES_HUT_THETA = 0.5  # Opening angle: cells seen under a smaller angle are lumped
+TREE_DEPTH = 16  # Levels below the root cell; the deepest cells are never split
+TREE_LEAF_SIZE = 8  # Bodies a cell can hold before it is split
+TREE_GROUP_SIZE = 16  # Neighbouring bodies walking the tree as one
+TREE_BATCH = 512  # Bodies handled together by one thread
+
+
+# Interleave the low 16 bits of each integer with zeros, for Morton keys
+def spread_bits(values):
+    values = values.astype(np.uint64)
+    values = (values | (values << np.uint64(8))) & np.uint64(0x00FF00FF)
+    values = (values | (values << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+    values = (values | (values << np.uint64(2))) & np.uint64(0x33333333)
+    values = (values | (values << np.uint64(1))) & np.uint64(0x55555555)
+    return values
+
+
+# Indices first[i], first[i] + 1, ... for counts[i] items, for every i
+def expand_ranges(first, counts):
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(first - offsets, counts) + np.arange(counts.sum())
+
+
+# Quadtree over a set of bodies, stored as flat arrays of cells. Bodies are
+# sorted along a Morton curve, so every cell holds a contiguous range of
+# them and the children of a cell are contiguous too. Cells are split level
+# by level while they hold more than TREE_LEAF_SIZE bodies, and their masses
+# and centers of mass come from prefix sums over the sorted bodies.
+class QuadTree:
+    def __init__(self, masses, positions, leaf_size=TREE_LEAF_SIZE):
+        masses = np.asarray(masses, dtype=float)
+        positions = np.asarray(positions, dtype=float)
+        count = len(masses)
+        low = positions.min(axis=0)
+        root_size = (positions.max(axis=0) - low).max() or 1.0
+        cells = 1 << TREE_DEPTH
+        grid = ((positions - low) * (cells / root_size)).astype(np.int64)
+        np.clip(grid, 0, cells - 1, out=grid)
+        keys = spread_bits(grid[:, 0]) | (spread_bits(grid[:, 1]) << np.uint64(1))
+        self.order = np.argsort(keys, kind="stable")
+        keys = keys[self.order]
+        self.masses = masses[self.order]
+        self.x = positions[self.order, 0]
+        self.y = positions[self.order, 1]
+
+        # Body ranges of the cells, level by level from the root
+        start, end = np.array([0]), np.array([count])
+        starts, ends, levels, first_children, child_counts = [], [], [], [], []
+        next_cell = 1  # Index of the first cell of the next level
+        for level in range(TREE_DEPTH + 1):
+            split = end - start > leaf_size
+            if level == TREE_DEPTH or not split.any():
+                split[:] = False
+            first_child = np.zeros(len(start), dtype=np.intp)
+            child_count = np.zeros(len(start), dtype=np.intp)
+            starts.append(start)
+            ends.append(end)
+            levels.append(np.full(len(start), level))
+            first_children.append(first_child)
+            child_counts.append(child_count)
+            if not split.any():
+                break
+            # The children of the split cells start wherever the key prefix
+            # of the next level changes
+            prefix = keys >> np.uint64(2 * (TREE_DEPTH - level - 1))
+            cut = np.zeros(count + 1, dtype=bool)
+            cut[1:-1] = prefix[1:] != prefix[:-1]
+            cut[start[split]] = True
+            cut[end[split]] = True
+            depth = np.bincount(start[split], minlength=count + 1) - np.bincount(
+                end[split], minlength=count + 1
+            )
+            inside = np.cumsum(depth) > 0
+            points = np.flatnonzero(cut)
+            keep = inside[points[:-1]]
+            child_start, child_end = points[:-1][keep], points[1:][keep]
+            first = np.searchsorted(child_start, start[split])
+            first_child[split] = next_cell + first
+            child_count[split] = np.searchsorted(child_start, end[split]) - first
+            next_cell += len(child_start)
+            start, end = child_start, child_end
+        self.start = np.concatenate(starts)
+        self.end = np.concatenate(ends)
+        self.first_child = np.concatenate(first_children)
+        self.child_count = np.concatenate(child_counts)
+        self.size2 = (root_size / 2.0 ** np.concatenate(levels)) ** 2
+
+        def range_sums(values):
+            sums = np.concatenate(([0.0], np.cumsum(values)))
+            return sums[self.end] - sums[self.start]
+
+        self.mass = range_sums(self.masses)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.com_x = range_sums(self.masses * self.x) / self.mass
+            self.com_y = range_sums(self.masses * self.y) / self.mass
+        # Positions for evaluating interactions, relative to the root's corner
+        self.x32 = (self.x - low[0]).astype(np.float32)
+        self.y32 = (self.y - low[1]).astype(np.float32)
+        self.com_x32 = (self.com_x - low[0]).astype(np.float32)
+        self.com_y32 = (self.com_y - low[1]).astype(np.float32)
+
+    def __len__(self):
+        return len(self.start)
+
+    # Pull of sources with the given g * mass at the given displacements, as
+    # (ax, ay) arrays of the same shape. Overwrites dx and dy. A source at
+    # zero distance, such as a body paired with itself, exerts no pull.
+    @staticmethod
+    def pull(g_masses, dx, dy, exponent, softening):
+        weight = dx * dx
+        weight += dy * dy
+        weight += softening * softening
+        weight += weight == 0  # Any distance will do, as dx and dy are 0
+        np.log(weight, out=weight)
+        weight *= -exponent / 2
+        np.exp(weight, out=weight)
+        weight *= g_masses
+        dx *= weight
+        dy *= weight
+        return dx, dy
+
+    # Accelerations of the sorted bodies first to last. They are split into
+    # groups of TREE_GROUP_SIZE neighbours along the Morton curve, and each
+    # group walks the tree as one: a cell is lumped into its center of mass
+    # for the whole group when it is seen under less than theta from the
+    # nearest point of the group's bounding box. Each step of the walk works
+    # on every (group, cell) pair of the frontier at once. The interactions
+    # found are then evaluated as dense blocks, padded to whole groups and
+    # leaves, with the padding given no mass.
+    def walk(self, first, last, g, exponent, softening, theta):
+        group_start = np.arange(first, last, TREE_GROUP_SIZE)
+        group_end = np.minimum(group_start + TREE_GROUP_SIZE, last)
+        low_x = np.minimum.reduceat(self.x[first:last], group_start - first)
+        high_x = np.maximum.reduceat(self.x[first:last], group_start - first)
+        low_y = np.minimum.reduceat(self.y[first:last], group_start - first)
+        high_y = np.maximum.reduceat(self.y[first:last], group_start - first)
+
+        group = np.arange(len(group_start))
+        cell = np.zeros(len(group), dtype=np.intp)
+        lumped, summed = [], []  # (groups, cells) pairs found by the walk
+        while len(group):
+            com_x, com_y = self.com_x[cell], self.com_y[cell]
+            # Distance from the center of mass to the group's bounding box
+            gap_x = np.maximum(low_x[group] - com_x, com_x - high_x[group])
+            gap_y = np.maximum(low_y[group] - com_y, com_y - high_y[group])
+            np.maximum(gap_x, 0, out=gap_x)
+            np.maximum(gap_y, 0, out=gap_y)
+            far = self.size2[cell] < theta * theta * (gap_x * gap_x + gap_y * gap_y)
+            # A cell holding bodies of the group is never lumped for it
+            far &= (self.end[cell] <= group_start[group]) | (
+                self.start[cell] >= group_end[group]
+            )
+            lumped.append((group[far], cell[far]))
+            group, cell = group[~far], cell[~far]
+            leaf = self.child_count[cell] == 0
+            summed.append((group[leaf], cell[leaf]))
+            group, cell = group[~leaf], cell[~leaf]
+            counts = self.child_count[cell]
+            group = np.repeat(group, counts)
+            cell = expand_ranges(self.first_child[cell], counts)
+
+        # Every group gets pulled by the centers of mass of its lumped cells
+        # and by each body of its nearby leaves. These sources are listed by
+        # group and evaluated against all members of the group at once, in
+        # float32 relative to the root cell's corner; sums are in float64.
+        group, cell = (np.concatenate(pairs) for pairs in zip(*lumped))
+        near_group, near_cell = (np.concatenate(pairs) for pairs in zip(*summed))
+        counts = self.end[near_cell] - self.start[near_cell]
+        other = expand_ranges(self.start[near_cell], counts)
+        source_group = np.concatenate((group, np.repeat(near_group, counts)))
+        order = np.argsort(source_group, kind="stable")
+        source_group = source_group[order]
+        source_x = np.concatenate((self.com_x32[cell], self.x32[other]))[order]
+        source_y = np.concatenate((self.com_y32[cell], self.y32[other]))[order]
+        g_masses = np.concatenate((self.mass[cell], self.masses[other]))[order]
+        g_masses = (g * g_masses).astype(np.float32)
+
+        # Members run down the rows and sources along them
+        members = np.arange(TREE_GROUP_SIZE)[:, None]
+        body = np.minimum(group_start + members, last - 1)
+        sources = np.bincount(source_group, minlength=len(group_start))
+        dx = np.repeat(self.x32[body], sources, axis=1)
+        dy = np.repeat(self.y32[body], sources, axis=1)
+        np.subtract(source_x, dx, out=dx)
+        np.subtract(source_y, dy, out=dy)
+        pull_x, pull_y = self.pull(g_masses, dx, dy, exponent, softening)
+        ax = np.zeros((TREE_GROUP_SIZE, len(group_start)))
+        ay = np.zeros((TREE_GROUP_SIZE, len(group_start)))
+        pulled = np.flatnonzero(sources)
+        first_source = (np.cumsum(sources) - sources)[pulled]
+        if len(pulled):
+            ax[:, pulled] = np.add.reduceat(pull_x, first_source, axis=1, dtype=float)
+            ay[:, pulled] = np.add.reduceat(pull_y, first_source, axis=1, dtype=float)
+        return ax.T.ravel()[: last - first], ay.T.ravel()[: last - first]
+
+    # Accelerations of all bodies, in their original order. Batches of bodies
+    # walk the tree on separate threads; NumPy releases the GIL in its loops.
+    # Given targets, an index array, only the batches holding them walk, and
+    # just the targets' accelerations are returned.
+    def acceleration(
+        self, g, exponent, softening=0.0, theta=BARNES_HUT_THETA, targets=None
+    ):
+        count = len(self.x)
+        sorted_acc = np.empty((count, 2))
+        if targets is None:
+            batches = range(0, count, TREE_BATCH)
+        else:
+            rank = np.empty(count, dtype=np.intp)
+            rank[self.order] = np.arange(count)
+            batches = np.unique(rank[targets] // TREE_BATCH) * TREE_BATCH
+
+        def walk_batch(first):
+            last = min(first + TREE_BATCH, count)
+            ax, ay = self.walk(first, last, g, exponent, softening, theta)
+            sorted_acc[first:last, 0] = ax
+            sorted_acc[first:last, 1] = ay
+
+        list(tree_threads().map(walk_batch, batches))
+        if targets is not None:
+            return sorted_acc[rank[targets]]
+        acc = np.empty((count, 2))
+        acc[self.order] = sorted_acc
+        return acc
+
+
+tree_pool = None  # Threads walking the tree, started by the first walk
+
+
+def tree_threads():
+    global tree_pool
+    if tree_pool is None:
+        tree_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+    return tree_pool
+
+
+# Barnes-Hut approximation of pairwise_acceleration(), in O(N log N): the
+# tree is rebuilt from the current positions on every call
+def barnes_hut_acceleration(
+    masses, positions, g, exponent, softening=0.0, theta=BARNES_HUT_THETA, targets=None
+):
+    tree = QuadTree(masses, positions)
+    return tree.acceleration(g, exponent, softening, theta, targets)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare Barnes-Hut gravity with direct summation on a "
+        "random cluster of bodies"
+    )
+    parser.add_argument(
+        "--bodies", type=int, nargs="+", default=[1000, 10_000, 100_000]
+    )
+    parser.add_argument(
+        "--theta", type=float, nargs="+", default=[0.3, BARNES_HUT_THETA, 0.8]
+    )
+    parser.add_argument(
+        "--exponent",
+        type=float,
+        default=1.31,
+        help="force exponent, as in collide.py (default: %(default)s)",
+    )
+    parser.add_argument("--softening", type=float, default=1.0)
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=1000,
+        help="bodies whose errors are measured (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--direct-limit",
+        type=int,
+        default=20_000,
+        help="largest body count timed with full direct summation "
+        "(default: %(default)s)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'bodies':>8} {'theta':>6} {'tree ms':>9} {'direct ms':>10} "
+          f"{'speedup':>8} {'median err':>11} {'99% err':>9}")  # fmt: skip
+    for count in args.bodies:
+        masses = rng.uniform(1, 10, count)
+        positions = rng.normal((1000, 600), 200, (count, 2))
+        forces = (1.0, args.exponent, args.softening)
+        direct_ms = None
+        if count <= args.direct_limit:
+            start = time.perf_counter()
+            pairwise_acceleration(masses, positions, *forces)
+            direct_ms = (time.perf_counter() - start) * 1000
+        samples = rng.choice(count, min(args.samples, count), replace=False)
+        reference = pairwise_acceleration(
+            masses, positions, *forces, targets=samples
+        )
+        scale = np.sqrt((reference**2).sum(axis=1).mean())
+        for theta in args.theta:
+            start = time.perf_counter()
+            acc = barnes_hut_acceleration(masses, positions, *forces, theta)
+            tree_ms = (time.perf_counter() - start) * 1000
+            # Errors relative to the RMS acceleration, as in-cluster forces
+            # nearly cancel and single relative errors blow up
+            error = np.linalg.norm(acc[samples] - reference, axis=1) / scale
+            direct = f"{direct_ms:10.1f}" if direct_ms else f"{'-':>10}"
+            speedup = f"{direct_ms / tree_ms:8.1f}" if direct_ms else f"{'-':>8}"
+            print(f"{count:8d} {theta:6.2f} {tree_ms:9.1f} {direct} {speedup} "
+                  f"{np.median(error):11.2e} {np.percentile(error, 99):9.2e}")  # fmt: skip
@@ -0,0 +1,334 @@
+import argparse
+import time
+import numpy as np
+from gravity import pairwise_acceleration, potential_energy
+
+# Time integrators for the three-body scenes.
+#
+# A stepper advances positions and velocities by dt, given accelerate(), which
+# maps positions to accelerations, and returns the new arrays:
+#
+#     positions, velocities = stepper(positions, velocities, dt, accelerate)
+#
+# Euler is first order and gains energy every orbit. Leapfrog and Yoshida are
+# symplectic: their energy error stays bounded instead of drifting, so they
+# hold an orbit with steps orders of magnitude longer. The Runge-Kutta
+# stepper is not symplectic, but it splits each step as finely as its error
+# tolerance demands, which suits close passes. Block timesteps split the step
+# only for the bodies that need it; they call accelerate(positions, targets)
+# to get the accelerations of just the target bodies, an index array.
+INTEGRATOR_NAMES = ["euler", "leapfrog", "yoshida4", "rk45", "block"]
+RK45_TOLERANCE = 0.01  # Pixels of position error allowed per rk45 step
+RK45_MAX_STEPS = 64  # Most rk45 steps per call, bounding the work of a frame
+BLOCK_ETA = 0.02  # Share of its |acceleration| / |jerk| time a body may step
+BLOCK_MAX_LEVEL = 12  # Most halvings of dt for a block timestep
+
+
+# Explicit Euler: positions from the old velocities, velocities from the
+# old accelerations. One force evaluation per step.
+def euler_step(positions, velocities, dt, accelerate):
+    acc = accelerate(positions)
+    return positions + velocities * dt, velocities + acc * dt
+
+
+# Drift-kick-drift leapfrog, second order. The force is evaluated once, at
+# the midpoint, so no acceleration has to be carried between steps, and
+# collisions or bounces may change positions between steps freely.
+def leapfrog_step(positions, velocities, dt, accelerate):
+    positions = positions + velocities * (dt / 2)
+    velocities = velocities + accelerate(positions) * dt
+    return positions + velocities * (dt / 2), velocities
+
+
+# Yoshida's fourth order composition of three leapfrog steps, the middle one
+# backwards in time. Three force evaluations per step.
+YOSHIDA_W1 = 1 / (2 - 2 ** (1 / 3))
+YOSHIDA_W0 = -(2 ** (1 / 3)) * YOSHIDA_W1
+YOSHIDA_DRIFTS = [
+    YOSHIDA_W1 / 2,
+    (YOSHIDA_W0 + YOSHIDA_W1) / 2,
+    (YOSHIDA_W0 + YOSHIDA_W1) / 2,
+    YOSHIDA_W1 / 2,
+]
+YOSHIDA_KICKS = [YOSHIDA_W1, YOSHIDA_W0, YOSHIDA_W1]
+
+
+def yoshida4_step(positions, velocities, dt, accelerate):
+    positions = positions + velocities * (YOSHIDA_DRIFTS[0] * dt)
+    for kick, drift in zip(YOSHIDA_KICKS, YOSHIDA_DRIFTS[1:]):
+        velocities = velocities + accelerate(positions) * (kick * dt)
+        positions = positions + velocities * (drift * dt)
+    return positions, velocities
+
+
+# Dormand-Prince 5(4) tableau. The last stage is evaluated at the fifth order
+# solution, so its acceleration starts the next step.
+DOPRI_A = [
+    [],
+    [1 / 5],
+    [3 / 40, 9 / 40],
+    [44 / 45, -56 / 15, 32 / 9],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+    [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84],
+]
+DOPRI_ERROR = np.array(  # Fifth minus fourth order weights
+    [
+        35 / 384 - 5179 / 57600,
+        0,
+        500 / 1113 - 7571 / 16695,
+        125 / 192 - 393 / 640,
+        -2187 / 6784 + 92097 / 339200,
+        11 / 84 - 187 / 2100,
+        -1 / 40,
+    ]
+)
+
+
+# Adaptive Runge-Kutta. Each call covers dt in as many steps as keep the
+# estimated error within tolerance pixels for positions, and tolerance
+# pixels per dt for velocities. The step size carries over between calls.
+# Steps never shrink below dt / max_steps: on close passes the error is let
+# past the tolerance rather than stalling the frame.
+class AdaptiveRungeKutta:
+    def __init__(self, tolerance=RK45_TOLERANCE, max_steps=RK45_MAX_STEPS):
+        self.tolerance = tolerance
+        self.max_steps = max_steps
+        self.step = None  # Step size proposed for the next call
+
+    def __call__(self, positions, velocities, dt, accelerate):
+        scale = np.stack((np.ones_like(positions), np.full_like(velocities, dt)))
+        scale /= self.tolerance
+        shortest = dt / self.max_steps
+        step = max(self.step or dt, shortest)
+        state = np.stack((positions, velocities))
+        acc = accelerate(positions)
+        elapsed = 0.0
+        while dt - elapsed > dt * 1e-9:  # Until dt is covered, bar rounding
+            h = min(step, dt - elapsed)
+            # Stage derivatives: the velocities and accelerations of each stage
+            slopes = np.empty((len(DOPRI_A),) + state.shape)
+            slopes[0] = state[1], acc
+            for stage, row in enumerate(DOPRI_A[1:], 1):
+                trial = state + h * np.tensordot(row, slopes[:stage], 1)
+                slopes[stage] = trial[1], accelerate(trial[0])
+            error = h * np.tensordot(DOPRI_ERROR, slopes, 1) * scale
+            error = np.sqrt(np.mean(error * error))
+            if error <= 1 or h <= shortest:
+                elapsed += h
+                state = trial
+                acc = slopes[-1, 1]
+            # Standard step control, growing or shrinking by at most 5 times
+            step = h * min(5.0, max(0.2, 0.9 * (error or 1e-10) ** -0.2))
+            step = max(step, shortest)
+        self.step = step
+        return state[0], state[1]
+
+
+# Hierarchical block timesteps: kick-drift-kick leapfrog in which each body
+# steps by dt / 2**level, its level chosen from its acceleration and jerk.
+# Time runs in ticks of dt / 2**max_level, and a body's step starts on a
+# multiple of its own length, so the steps nest and all of them end with dt.
+# Between step ends every body drifts; at each step end only the bodies due
+# get forces, which they use to close their step and open the next one.
+# A few bodies on tight orbits then cost little more than themselves.
+#
+# Jerk is the change of a body's acceleration over its last step. Before
+# there is one, it is the change over dt along the path the acceleration
+# predicts, which also serves bodies that start at rest.
+class BlockTimesteps:
+    def __init__(self, eta=BLOCK_ETA, max_level=BLOCK_MAX_LEVEL):
+        self.eta = eta
+        self.max_level = max_level
+        self.positions = None  # Positions that acc was found at
+        self.acc = None
+        self.jerk = None
+
+    # Ticks each of the bodies may step from the given tick on: the largest
+    # power of two within eta * |acc| / |jerk| that divides the tick
+    def spans(self, acc, jerk, tick_length, tick):
+        ticks = 1 << self.max_level
+        with np.errstate(divide="ignore", invalid="ignore"):
+            allowed = self.eta * np.hypot(*acc.T) / np.hypot(*jerk.T) / tick_length
+        allowed = np.clip(np.nan_to_num(allowed, nan=ticks), 1, ticks)
+        spans = np.exp2(np.floor(np.log2(allowed))).astype(np.int64)
+        return np.minimum(spans, tick & -tick if tick else ticks)
+
+    def __call__(self, positions, velocities, dt, accelerate):
+        ticks = 1 << self.max_level
+        tick_length = dt / ticks
+        positions = np.array(positions, dtype=float)
+        velocities = np.array(velocities, dtype=float)
+        # Accelerations from the end of the last call hold, unless the scene
+        # has moved bodies since, by bounces or collisions
+        if self.positions is None or not np.array_equal(self.positions, positions):
+            self.acc = accelerate(positions)
+        if self.jerk is None or len(self.jerk) != len(positions):
+            ahead = positions + velocities * dt + self.acc * (dt * dt / 2)
+            self.jerk = (accelerate(ahead) - self.acc) / dt
+        acc, jerk = self.acc, self.jerk
+
+        span = self.spans(acc, jerk, tick_length, 0)
+        due = span.copy()
+        velocities += acc * (span * tick_length / 2)[:, None]
+        tick = 0
+        while tick < ticks:
+            following = due.min()
+            positions += velocities * ((following - tick) * tick_length)
+            tick = following
+            active = np.flatnonzero(due == tick)
+            if len(active) < len(positions):
+                new_acc = accelerate(positions, active)
+            else:
+                new_acc = accelerate(positions)  # Full kernels share pair work
+            step = span[active] * tick_length
+            jerk[active] = (new_acc - acc[active]) / step[:, None]
+            acc[active] = new_acc
+            if tick < ticks:
+                span[active] = self.spans(new_acc, jerk[active], tick_length, tick)
+            else:
+                span[active] = 0
+            kick = (step + span[active] * tick_length) / 2
+            velocities[active] += new_acc * kick[:, None]
+            due[active] = tick + span[active]
+        self.positions = positions.copy()
+        return positions, velocities
+
+
+# The stepper called name, fresh for one scene
+def make_integrator(name, tolerance=RK45_TOLERANCE):
+    if name == "rk45":
+        return AdaptiveRungeKutta(tolerance)
+    if name == "block":
+        return BlockTimesteps()
+    return {
+        "euler": euler_step,
+        "leapfrog": leapfrog_step,
+        "yoshida4": yoshida4_step,
+    }[name]
+
+
+# The two stars of collide.py, with its constants: masses, positions,
+# velocities, the (g, exponent, softening) of the force law, and the time of
+# the small star's orbit
+def two_stars():
+    masses = np.array([1.98e30, 6e24])
+    positions = np.array([[1000.0, 600.0], [1300.0, 600.0]])
+    velocities = np.array([[0.0, 0.0], [2e8, 2e10]])
+    period = 2 * np.pi * 300 / 2e10
+    return masses, positions, velocities, (5e-12, 1.31, 1.0), period
+
+
+# Loose bodies of unit mass scattered over the window, with a few heavy
+# binaries a pixel wide among them, under Newtonian gravity, and the time of
+# a binary's orbit
+def binary_cluster(rng, bodies, binaries):
+    g, exponent, softening = 1.0, 3.0, 0.01
+    mass, radius = 100.0, 0.5  # Of each star of a binary, and of its orbit
+    loose = bodies - 2 * binaries
+    masses = np.concatenate((np.ones(loose), np.full(2 * binaries, mass)))
+    centers = rng.uniform((0, 0), (2000, 1200), (binaries, 2))
+    angle = rng.uniform(0, 2 * np.pi, binaries)
+    offset = radius * np.column_stack((np.cos(angle), np.sin(angle)))
+    # Circular orbits: speed**2 / radius = g * mass / (2 * radius)**2
+    speed = np.sqrt(g * mass / (4 * radius))
+    spin = speed * np.column_stack((-np.sin(angle), np.cos(angle)))
+    scattered = rng.uniform((0, 0), (2000, 1200), (loose, 2))
+    positions = np.concatenate((scattered, centers + offset, centers - offset))
+    velocities = np.concatenate((np.zeros((loose, 2)), spin, -spin))
+    period = 2 * np.pi * radius / speed
+    return masses, positions, velocities, (g, exponent, softening), period
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the integrators on the two stars of collide.py, "
+        "or on a cluster of loose bodies and tight binaries"
+    )
+    parser.add_argument(
+        "--binaries",
+        type=int,
+        default=0,
+        help="binaries in a cluster to integrate instead of the two stars",
+    )
+    parser.add_argument(
+        "--bodies",
+        type=int,
+        default=1000,
+        help="bodies in the cluster, binaries included (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--orbits",
+        type=float,
+        default=5,
+        help="simulated time, in orbits of the small star or of a binary "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--dt",
+        type=float,
+        nargs="+",
+        help="time steps to try (default: 5e-10 5e-9 2e-8 for the two stars, "
+        "where collide.py uses 5e-10, and 1e-3 0.25 for a cluster)",
+    )
+    parser.add_argument(
+        "--integrators", nargs="+", choices=INTEGRATOR_NAMES, default=INTEGRATOR_NAMES
+    )
+    parser.add_argument("--tolerance", type=float, default=RK45_TOLERANCE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.binaries:
+        scene = binary_cluster(rng, args.bodies, args.binaries)
+        steps = args.dt or [1e-3, 0.25]
+    else:
+        scene = two_stars()
+        steps = args.dt or [5e-10, 5e-9, 2e-8]
+    masses, start_positions, start_velocities, forces, period = scene
+
+    def kinetic_energy(velocities):
+        return 0.5 * masses @ (velocities * velocities).sum(axis=1)
+
+    def energy(positions, velocities):
+        return kinetic_energy(velocities) + potential_energy(
+            masses, positions, *forces
+        )
+
+    # The force laws' potentials have no common zero, so energy errors are
+    # measured against the starting kinetic energy
+    start_energy = energy(start_positions, start_velocities)
+    energy_scale = kinetic_energy(start_velocities)
+    print(f"{'integrator':>10} {'dt':>8} {'ms':>9} {'body forces':>12} "
+          f"{'energy err':>11} {'max err':>9}")  # fmt: skip
+    for dt in steps:
+        for name in args.integrators:
+            stepper = make_integrator(name, args.tolerance)
+            evaluations = 0
+
+            # Counts the bodies whose accelerations are found
+            def accelerate(positions, targets=None):
+                global evaluations
+                evaluations += len(positions) if targets is None else len(targets)
+                return pairwise_acceleration(
+                    masses, positions, *forces, targets=targets
+                )
+
+            positions, velocities = start_positions, start_velocities
+            drift = worst = 0.0
+            elapsed = 0.0
+            count = int(round(args.orbits * period / dt))
+            for step in range(count):
+                start = time.perf_counter()
+                positions, velocities = stepper(
+                    positions, velocities, dt, accelerate
+                )
+                elapsed += (time.perf_counter() - start) * 1000
+                # Energy at about 200 points along the way, as it costs a
+                # pass over all pairs
+                if step % max(1, count // 200) == 0 or step == count - 1:
+                    drift = abs(energy(positions, velocities) - start_energy)
+                    drift /= energy_scale
+                    worst = max(worst, drift)
+            print(f"{name:>10} {dt:8.0e} {elapsed:9.0f} {evaluations:12d} "
+                  f"{drift:11.2e} {worst:9.2e}")  # fmt: skip
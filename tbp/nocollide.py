@@ -1,6 +1,56 @@
+import argparse
 import pygame
 import numpy as np
 from pygame.locals import QUIT
+from gravity import BARNES_HUT_THETA, barnes_hut_acceleration, pairwise_acceleration
+from integrators import INTEGRATOR_NAMES, RK45_TOLERANCE, make_integrator
+
+parser = argparse.ArgumentParser(description="Three-Body Problem")
+parser.add_argument(
+    "--bodies",
+    type=int,
+    default=2,
+    help="number of bodies; those past the first two start like star 1, "
+    "scattered over the window (default: %(default)s)",
+)
+parser.add_argument("--seed", type=int, help="seed for the scattered bodies")
+parser.add_argument(
+    "--gravity",
+    choices=["direct", "barnes-hut"],
+    default="direct",
+    help="sum every pair, or approximate distant bodies with a quadtree; "
+    "worth it from a few thousand bodies (default: %(default)s)",
+)
+parser.add_argument(
+    "--theta",
+    type=float,
+    default=BARNES_HUT_THETA,
+    help="Barnes-Hut opening angle; larger is faster and less accurate "
+    "(default: %(default)s)",
+)
+parser.add_argument(
+    "--integrator",
+    choices=INTEGRATOR_NAMES,
+    default="euler",
+    help="time integrator; leapfrog and yoshida4 keep orbits with far longer "
+    "steps, and block gives each body its own (default: %(default)s)",
+)
+parser.add_argument(
+    "--dt", type=float, help="simulated time per frame (default: the scene's own)"
+)
+parser.add_argument(
+    "--substeps",
+    type=int,
+    default=1,
+    help="integrator steps per frame (default: %(default)s)",
+)
+parser.add_argument(
+    "--tolerance",
+    type=float,
+    default=RK45_TOLERANCE,
+    help="rk45 position error allowed per step, in pixels (default: %(default)s)",
+)
+args = parser.parse_args()
 
 # Initialize Pygame
 pygame.init()
@@ -19,7 +69,9 @@ colors = [RED, GREEN, BLUE]
 
 # Constants
 G = 1.4  # Gravitational constant in our simulation
-dt = 0.01  # Time step for the integrator
+dt = args.dt or 0.01  # Simulated time per frame
+FORCE_EXPONENT = 1.9  # Pull falls off as distance ** (1 - FORCE_EXPONENT)
+SOFTENING = 1.0  # Pixels added to distances in quadrature, keeping them finite
 MASS_SCALE = 300000  # Scale factor for drawing the stars
 
 # Initial conditions
@@ -35,36 +87,49 @@ velocities[0, 1] = 0  # Star 0 velocity in y-direction
 velocities[1, 1] = 0  # Star 1 velocity in y-direction
 velocities[0, 0] = 0  # Star 0 velocity in x-direction
 velocities[1, 0] = 0  # Star 1 velocity in x-direction
-trail_points = [[] for _ in positions]  # List to store the trail points for each circle
+
+# Bodies past the first two copy star 1's mass and velocity at random places
+extra_bodies = max(0, args.bodies - len(masses))
+rng = np.random.default_rng(args.seed)
+masses = np.concatenate((masses, np.full(extra_bodies, masses[1])))
+positions = np.concatenate(
+    (positions, rng.uniform((0, 0), (WIDTH, HEIGHT), (extra_bodies, 2)))
+)
+velocities = np.concatenate((velocities, np.tile(velocities[1], (extra_bodies, 1))))
+
+# List to store the trail points for each circle; only the colored stars
+# leave trails
+trail_points = [[] for _ in positions[: len(colors)]]
 
 
 # Define the acceleration due to gravity
-def gravity_acceleration(masses, positions):
-    acc = np.zeros_like(positions)
-    num_bodies = len(masses)
-    for i in range(num_bodies):
-        for j in range(num_bodies):
-            if i != j:
-                r_vec = positions[j] - positions[i]
-                r_mag = np.linalg.norm(r_vec)
-                acc[i] += G * masses[j] * r_vec / r_mag**1.9
-    return acc
+def gravity_acceleration(masses, positions, targets=None):
+    if args.gravity == "barnes-hut":
+        return barnes_hut_acceleration(
+            masses, positions, G, FORCE_EXPONENT, SOFTENING, args.theta, targets
+        )
+    return pairwise_acceleration(
+        masses, positions, G, FORCE_EXPONENT, SOFTENING, targets=targets
+    )
+
+
+integrate = make_integrator(args.integrator, args.tolerance)
 
 
 # Define the update function
 def update_system(masses, positions, velocities, dt):
-    pos_new = positions + velocities * dt
-    acc = gravity_acceleration(masses, positions)
-    vel_new = velocities + acc * dt
-
-    # Check for boundary collision and bounce if necessary
-    for i, pos in enumerate(pos_new):
-        if pos[0] <= 0 or pos[0] >= WIDTH:  # Check x boundaries
-            vel_new[i, 0] = -vel_new[i, 0] + (0.8*vel_new[i, 0])  # Reverse x velocity
-            pos_new[i, 0] = max(0, min(pos[0], WIDTH))  # Keep inside window
-        if pos[1] <= 0 or pos[1] >= HEIGHT:  # Check y boundaries
-            vel_new[i, 1] = -vel_new[i, 1] + (0.8*vel_new[i, 1])  # Reverse y velocity
-            pos_new[i, 1] = max(0, min(pos[1], HEIGHT))  # Keep inside window
+    def accelerate(positions, targets=None):
+        return gravity_acceleration(masses, positions, targets)
+
+    pos_new, vel_new = positions, velocities
+    for _ in range(args.substeps):
+        pos_new, vel_new = integrate(pos_new, vel_new, dt / args.substeps, accelerate)
+
+    # Check for boundary collision and bounce if necessary, on all bodies at once
+    for axis, size in ((0, WIDTH), (1, HEIGHT)):
+        outside = (pos_new[:, axis] <= 0) | (pos_new[:, axis] >= size)
+        vel_new[outside, axis] *= -0.2  # Reverse the velocity, keeping a fifth
+        np.clip(pos_new[:, axis], 0, size, out=pos_new[:, axis])  # Keep inside window
 
     return pos_new, vel_new
 
@@ -79,22 +144,24 @@ while running:
     positions, velocities = update_system(masses, positions, velocities, dt)
 
     for i, (pos, mass) in enumerate(zip(positions, masses)):
+        color = colors[i % len(colors)]
         # Add position to trail points, ensuring it's a valid integer tuple
-        trail_points[i].append(tuple(pos.astype(int)))
+        if i < len(trail_points):
+            trail_points[i].append(tuple(pos.astype(int)))
 
         # Draw the trail if there are at least 2 points, using the star's color
-        if len(trail_points[i]) >= 2:
+        if i < len(trail_points) and len(trail_points[i]) >= 2:
             if len(trail_points[i]) > 50000:  # Limit the number of trail points
                 trail_points[i].pop(0)
             # Use the color specific to this star for the trail
-            pygame.draw.lines(screen, colors[i], False, trail_points[i], 3)  # Draw the trail line
+            pygame.draw.lines(screen, color, False, trail_points[i], 3)  # Draw the trail line
 
         # Draw the circle with a black border and fill with the star's color
         pygame.draw.circle(
             screen, (0,0,0), pos.astype(int), int(np.sqrt(mass / MASS_SCALE) + 3)
         )
         pygame.draw.circle(
-            screen, colors[i], pos.astype(int), int(np.sqrt(mass / MASS_SCALE))
+            screen, color, pos.astype(int), int(np.sqrt(mass / MASS_SCALE))
         )
 
     pygame.display.flip()